@@ -0,0 +1,129 @@
+"""
+Monte Carlo tree searcher for simulators behind a slow call, built on asyncio.
+
+Terminal nodes may return an awaitable from `reward()`, e.g. a coroutine calling a remote
+service. `AsyncMCTS.search_async` keeps up to `max_concurrency` iterations in flight, each
+awaiting its rewards while the others select, expand and back up. Selection, expansion and
+backup never await, so they run atomically on the event loop without a lock.
+"""
+import argparse
+import asyncio
+import inspect
+import random
+import time
+
+from binary_tree import make_binary_tree
+from monte_carlo_tree_search import MCTS
+
+
+class AsyncMCTS(MCTS):
+    """Searcher running iterations concurrently on an event loop.
+
+    While the rewards of a leaf are pending, its path carries a virtual visit with reward
+    `virtual_loss` so concurrent selections spread over other leaves.
+    """
+
+    def __init__(self, exploration_weight=1.0, virtual_loss=0.0, max_concurrency=8):
+        super().__init__(exploration_weight=exploration_weight)
+        self.virtual_loss = virtual_loss
+        self.max_concurrency = max_concurrency
+
+    async def simulate_async(self, node):
+        "Reward of a random simulation from node, awaiting it if the terminal node returns an awaitable"
+        reward = self.rollout(node).reward()
+        if inspect.isawaitable(reward):
+            reward = await reward
+        return reward
+
+    async def run_async(self, node, num_rollout):
+        "Run one iteration of select -> expand -> simulation(rollout) -> backup, awaiting the rollouts"
+        path = self.select(node)
+        leaf = path[-1]
+        self.expand(leaf)
+        self.add_virtual_loss(path, self.virtual_loss)
+        try:
+            rewards = await asyncio.gather(*(self.simulate_async(leaf) for _ in range(num_rollout)))
+        finally:
+            self.revert_virtual_loss(path, self.virtual_loss)
+        self.backup(path, sum(rewards))
+
+    async def search_async(self, node, num_iter, num_rollout=1):
+        "Run `num_iter` iterations from node, at most `max_concurrency` of them at a time"
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def limited():
+            async with semaphore:
+                await self.run_async(node, num_rollout)
+
+        await asyncio.gather(*(limited() for _ in range(num_iter)))
+
+
+class LatencyNode:
+    """Wraps a tree node so that its reward takes `latency` seconds, a fake remote simulator.
+
+    `reward()` is a coroutine sleeping on the event loop, `reward_blocking()` sleeps the thread,
+    as a synchronous client would.
+    """
+
+    def __init__(self, node, latency):
+        self.node = node
+        self.latency = latency
+
+    def __repr__(self):
+        return repr(self.node)
+
+    def __hash__(self):
+        return hash(self.node)
+
+    def __eq__(self, other):
+        return isinstance(other, LatencyNode) and self.node == other.node
+
+    def is_terminal(self):
+        return self.node.is_terminal()
+
+    def find_children(self):
+        return {LatencyNode(c, self.latency) for c in self.node.find_children()}
+
+    def find_random_child(self):
+        child = self.node.find_random_child()
+        return None if child is None else LatencyNode(child, self.latency)
+
+    async def reward(self):
+        await asyncio.sleep(self.latency)
+        return self.node.reward()
+
+    def reward_blocking(self):
+        time.sleep(self.latency)
+        return self.node.reward()
+
+
+def benchmark(depth, num_iter, exploration_weight, latency, max_concurrency, seed):
+    "Iterations per second of one move with blocking rewards and with async rewards"
+    random.seed(seed)
+    root, _ = make_binary_tree(depth=depth)
+    root = LatencyNode(root, latency)
+
+    mcts = MCTS(exploration_weight=exploration_weight)
+    mcts.simulate = lambda node: mcts.rollout(node).reward_blocking()
+    start = time.perf_counter()
+    for _ in range(num_iter):
+        mcts.run(root, num_rollout=1)
+    print("blocking: {:8.1f} iterations/s".format(num_iter / (time.perf_counter() - start)))
+
+    mcts = AsyncMCTS(exploration_weight=exploration_weight, max_concurrency=max_concurrency)
+    start = time.perf_counter()
+    asyncio.run(mcts.search_async(root, num_iter))
+    print("   async: {:8.1f} iterations/s, best move {}".format(num_iter / (time.perf_counter() - start),
+                                                                mcts.choose(root)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MCTS with a fake slow simulator, blocking against async')
+    parser.add_argument("--num_iter", type=int, default=200, help="number of MCTS iterations")
+    parser.add_argument("--depth", type=int, default=12, help="number of depth of the binary tree")
+    parser.add_argument("--exploration_weight", type=float, default=51, help="exploration weight, c number in UCT")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds every reward call takes")
+    parser.add_argument("--max_concurrency", type=int, default=32, help="number of iterations in flight")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random tree")
+    args = parser.parse_args()
+    benchmark(args.depth, args.num_iter, args.exploration_weight, args.latency, args.max_concurrency, args.seed)
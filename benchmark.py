@@ -0,0 +1,234 @@
+"""
+Reproducible benchmark of MCTS against exhaustive search on random binary trees.
+
+Every configuration of the sweep runs once per seed on the same trees, so the search results
+are reproducible. Its time is the best of `repeat` timings, each calling the run until `min_time`
+seconds have passed, so a single disturbed run does not decide a comparison. Results are written
+as CSV or JSON records tagged with the git commit, and runs of different commits can be compared
+with --baseline.
+"""
+from itertools import product
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from binary_tree import make_binary_tree, make_implicit_binary_tree
+from monte_carlo_tree_search import MCTS, ArrayMCTS, SolverMCTS
+from uninformed_tree_search import iter_tree_search
+
+FIELDS = ["commit", "algorithm", "store", "depth", "num_iter", "num_rollout", "exploration_weight", "seed",
+          "elapsed", "iterations", "iterations_per_sec", "nodes", "nodes_per_sec", "peak_memory_kb",
+          "found", "best", "regret"]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def make_tree(depth, seed, implicit):
+    "Root and true max leaf value of the tree of a seed"
+    random.seed(seed)
+    np.random.seed(seed)
+    if implicit:
+        root = make_implicit_binary_tree(depth)
+        return root, root.tree.max_leaf()[1]
+    root, leaf_nodes_dict = make_binary_tree(depth=depth)
+    return root, max(leaf_nodes_dict.values())
+
+
+def mcts_run(root, num_iter, num_rollout, exploration_weight, store):
+    "Play from root to a leaf, returns (found value, iterations, expanded nodes)"
+    mcts = {"array": ArrayMCTS, "solver": SolverMCTS}.get(store, MCTS)(exploration_weight)
+    iterations, nodes = 0, 0
+    node = root
+    while not node.is_terminal():
+        size = mcts.tree_size()
+        for _ in range(num_iter):
+            if store == "solver" and mcts.is_proven(node):
+                break  # the solver knows the best move
+            mcts.run(node, num_rollout=num_rollout)
+            iterations += 1
+        nodes += mcts.tree_size() - size
+        node = mcts.choose(node)
+        mcts.advance_root(node)
+    return node.reward(), iterations, nodes
+
+
+def exhaustive_run(root):
+    "Visit every node, returns (max leaf value, visited nodes, visited nodes)"
+    best, nodes = float("-inf"), 0
+    for node in iter_tree_search(root, mode="dfs"):
+        nodes += 1
+        if node.is_terminal():
+            best = max(best, node.reward())
+    return best, nodes, nodes
+
+
+def measure(run, memory, repeat=5, min_time=0.05):
+    """Time `run()`, and its peak traced memory in a separate identical run when `memory` is set.
+
+    The time is the best of `repeat` timings, each the mean of as many runs as fit in `min_time`
+    seconds. Every run starts from the same random state.
+    """
+    state = random.getstate(), np.random.get_state()
+
+    def restore():
+        random.setstate(state[0])
+        np.random.set_state(state[1])
+
+    elapsed = float("inf")
+    for _ in range(repeat):
+        calls, start = 0, time.perf_counter()
+        while True:
+            restore()
+            result = run()
+            calls += 1
+            total = time.perf_counter() - start
+            if total >= min_time:
+                break
+        elapsed = min(elapsed, total / calls)
+    peak = None
+    if memory:
+        # tracing slows Python down, so it gets its own run
+        restore()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def benchmark(depths, num_iters, num_rollouts, exploration_weights, seeds, stores=("dict",), implicit=True,
+              exhaustive=True, memory=True, repeat=5, min_time=0.05):
+    "List of result records of the sweep"
+    commit = git_commit()
+    records = []
+    for depth, seed in product(depths, seeds):
+        configs = [("mcts", store, num_iter, num_rollout, c) for store, num_iter, num_rollout, c
+                   in product(stores, num_iters, num_rollouts, exploration_weights)]
+        if exhaustive:
+            configs.append(("exhaustive", None, None, None, None))
+        for algorithm, store, num_iter, num_rollout, c in configs:
+            root, best = make_tree(depth, seed, implicit)
+            if algorithm == "mcts":
+                run = lambda: mcts_run(root, num_iter, num_rollout, c, store)
+            else:
+                run = lambda: exhaustive_run(root)
+            (found, iterations, nodes), elapsed, peak = measure(run, memory, repeat, min_time)
+            records.append({
+                "commit": commit, "algorithm": algorithm, "store": store, "depth": depth, "num_iter": num_iter,
+                "num_rollout": num_rollout, "exploration_weight": c, "seed": seed, "elapsed": elapsed,
+                "iterations": iterations, "iterations_per_sec": iterations / elapsed, "nodes": nodes,
+                "nodes_per_sec": nodes / elapsed, "peak_memory_kb": peak, "found": found, "best": best,
+                "regret": best - found,
+            })
+    return records
+
+
+def config_key(record):
+    return tuple(record[f] for f in ["algorithm", "store", "depth", "num_iter", "num_rollout", "exploration_weight"])
+
+
+def summarize(records):
+    "Mean of the metrics of every configuration over the seeds"
+    groups = {}
+    for record in records:
+        groups.setdefault(config_key(record), []).append(record)
+    summary = {}
+    for key, group in groups.items():
+        summary[key] = {metric: float(np.mean([r[metric] for r in group]))
+                        for metric in ["iterations_per_sec", "nodes_per_sec", "regret"]}
+        memory = [r["peak_memory_kb"] for r in group if r["peak_memory_kb"] is not None]
+        summary[key]["peak_memory_kb"] = float(np.mean(memory)) if memory else None
+    return summary
+
+
+def compare(summary, baseline_summary, tolerance):
+    "Configurations whose nodes per second dropped more than `tolerance` (a fraction) below the baseline"
+    regressions = []
+    for key, metrics in summary.items():
+        if key in baseline_summary:
+            before, now = baseline_summary[key]["nodes_per_sec"], metrics["nodes_per_sec"]
+            if now < before * (1 - tolerance):
+                regressions.append((key, before, now))
+    return regressions
+
+
+def write_records(records, path):
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "records": records}, f,
+                      indent=1)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+
+def read_records(path):
+    if path.endswith(".json"):
+        with open(path) as f:
+            return json.load(f)["records"]
+    with open(path, newline="") as f:
+        records = list(csv.DictReader(f))
+    # CSV stores everything as text, the configuration has to match the typed records again
+    for record in records:
+        for field in FIELDS:
+            if record[field] == "":
+                record[field] = None
+            elif field in ("depth", "num_iter", "num_rollout", "seed", "iterations", "nodes"):
+                record[field] = int(record[field])
+            elif field not in ("commit", "algorithm", "store"):
+                record[field] = float(record[field])
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark MCTS against exhaustive search on random binary trees')
+    parser.add_argument("--depth", type=int, nargs="+", default=[12], help="depths of the binary trees")
+    parser.add_argument("--num_iter", type=int, nargs="+", default=[50], help="MCTS iterations before each move")
+    parser.add_argument("--num_rollout", type=int, nargs="+", default=[1], help="rollouts in a MCTS iteration")
+    parser.add_argument("--exploration_weight", type=float, nargs="+", default=[51], help="c numbers in UCT")
+    parser.add_argument("--store", choices=["dict", "array", "solver"], nargs="+", default=["dict"], help="MCTS node stores")
+    parser.add_argument("--seeds", type=int, default=5, help="number of seeds, 0 .. seeds - 1")
+    # nodes of implicit trees hash by (level, index), so the searches make the same choices in every
+    # process, nodes from make_binary_tree hash by identity and the order of their children varies
+    parser.add_argument("--explicit", action="store_true", help="use trees from make_binary_tree instead of implicit")
+    parser.add_argument("--no_exhaustive", action="store_true", help="skip the exhaustive search baseline")
+    parser.add_argument("--no_memory", action="store_true", help="skip the traced run measuring peak memory")
+    parser.add_argument("--repeat", type=int, default=5, help="timings of every run, the best one is kept")
+    parser.add_argument("--min_time", type=float, default=0.05, help="least seconds of a timing, short runs are repeated")
+    parser.add_argument("--output", default="benchmark.csv", help="result file, .csv or .json")
+    parser.add_argument("--baseline", default=None, help="result file of an earlier commit to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative drop of nodes per second against the baseline")
+    args = parser.parse_args()
+
+    records = benchmark(args.depth, args.num_iter, args.num_rollout, args.exploration_weight, range(args.seeds),
+                        stores=args.store, implicit=not args.explicit, exhaustive=not args.no_exhaustive,
+                        memory=not args.no_memory, repeat=args.repeat, min_time=args.min_time)
+    write_records(records, args.output)
+    summary = summarize(records)
+    for key, metrics in summary.items():
+        print("{}: {:.0f} iterations/s, {:.0f} nodes/s, regret {:.3f}, peak memory {} KiB".format(
+            key, metrics["iterations_per_sec"], metrics["nodes_per_sec"], metrics["regret"],
+            "n/a" if metrics["peak_memory_kb"] is None else "{:.0f}".format(metrics["peak_memory_kb"])))
+    if args.baseline is not None:
+        regressions = compare(summary, summarize(read_records(args.baseline)), args.tolerance)
+        for key, before, now in regressions:
+            print("regression {}: {:.0f} -> {:.0f} nodes/s".format(key, before, now))
+        sys.exit(1 if regressions else 0)
@@ -1,6 +1,8 @@
 from random import choice
 import random
 
+import numpy as np
+
 
 class Node:
     def __init__(self, node_id=None):
@@ -8,6 +10,11 @@ class Node:
         self.right = None
         self.node_id = node_id
         self.value = None
+        # position in a tree from make_binary_tree, used to jump straight to a random leaf
+        self.level = None
+        self.index = None
+        self.leaves = None  # all leaves of the tree, left to right
+        self.leaf_values = None  # array of their values
 
     def __repr__(self):
         return "node@" + str(self.node_id)
@@ -42,6 +49,23 @@ class Node:
     def reward(self):
         return self.value
 
+    def sample_terminal_descendant(self):
+        "Random leaf below this node, drawing all left/right turns as one random number"
+        if self.leaves is None:
+            node = self
+            while not node.is_terminal():
+                node = node.find_random_child()
+            return node
+        height = len(self.leaves).bit_length() - 1 - self.level
+        return self.leaves[(self.index << height) + random.getrandbits(height)]
+
+    def sample_terminal_rewards(self, size):
+        "Values of `size` random leaves below this node, as an array"
+        if self.leaves is None:
+            return np.array([self.sample_terminal_descendant().reward() for _ in range(size)], dtype=float)
+        height = len(self.leaves).bit_length() - 1 - self.level
+        return self.leaf_values[(self.index << height) + np.random.randint(0, 2 ** height, size)]
+
 
 def make_binary_tree(depth=12):
     all_nodes = []
@@ -53,12 +77,19 @@ def make_binary_tree(depth=12):
         all_nodes.append(nodes_at_depth)
 
     leaf_nodes_dict = dict()
+    leaves = all_nodes[-1]
+    leaf_values = np.empty(len(leaves))
     for level, nodes in enumerate(all_nodes):
         for loc, n in enumerate(nodes):
+            n.level = level
+            n.index = loc
+            n.leaves = leaves
+            n.leaf_values = leaf_values
             if level >= len(all_nodes) - 1:
                 # we assign reward value to leaf nodes of the tree
                 n.value = random.uniform(0, 100)
                 leaf_nodes_dict[n] = n.value
+                leaf_values[loc] = n.value
             else:
                 left = all_nodes[level + 1][2 * loc]
                 right = all_nodes[level + 1][2 * loc + 1]
@@ -66,3 +97,156 @@ def make_binary_tree(depth=12):
                 n.right = right
     root = all_nodes[0][0]
     return root, leaf_nodes_dict
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _splitmix64(x):
+    "SplitMix64 finalizer on a Python int"
+    z = (x + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def _splitmix64_array(x):
+    "SplitMix64 finalizer on a uint64 array, same values as `_splitmix64`"
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class ImplicitBinaryTree:
+    """Complete binary tree of a given depth whose nodes only exist when the search touches them.
+
+    A node is identified by (level, index), the children of (level, i) are (level + 1, 2i) and
+    (level + 1, 2i + 1). Leaf rewards in [0, 100) come from a seeded hash of the leaf index, or
+    from a float64 array (e.g. a memory-mapped file) holding the 2^depth leaf rewards.
+    """
+
+    def __init__(self, depth=12, seed=0, rewards=None):
+        if rewards is not None and len(rewards) != 2 ** depth:
+            raise ValueError("rewards must hold 2^depth = {} leaf values, got {}".format(2 ** depth, len(rewards)))
+        self.depth = depth
+        self.seed = seed
+        self.rewards = rewards
+        self._key = _splitmix64(seed & _MASK64)
+
+    @property
+    def root(self):
+        return ImplicitNode(self, 0, 0)
+
+    def leaf(self, index):
+        return ImplicitNode(self, self.depth, index)
+
+    def leaf_reward(self, index):
+        if self.rewards is not None:
+            return float(self.rewards[index])
+        return (_splitmix64(index ^ self._key) >> 11) * 2.0 ** -53 * 100
+
+    def leaf_rewards(self, indices):
+        "Rewards of the leaves at `indices` as a float array"
+        if self.rewards is not None:
+            return np.asarray(self.rewards[indices], dtype=float)
+        z = _splitmix64_array(np.asarray(indices, dtype=np.uint64) ^ np.uint64(self._key))
+        return (z >> np.uint64(11)).astype(float) * 2.0 ** -53 * 100
+
+    def _extreme_leaf(self, arg, chunk_size):
+        # extreme of every chunk first, then the extreme among those
+        candidates = []
+        for start in range(0, 2 ** self.depth, chunk_size):
+            values = self.leaf_rewards(np.arange(start, min(start + chunk_size, 2 ** self.depth)))
+            i = int(arg(values))
+            candidates.append((start + i, float(values[i])))
+        index, value = candidates[int(arg([v for _, v in candidates]))]
+        return self.leaf(index), value
+
+    def max_leaf(self, chunk_size=1 << 20):
+        "(node, value) of the best leaf, scanning the leaf rewards chunk by chunk"
+        return self._extreme_leaf(np.argmax, chunk_size)
+
+    def min_leaf(self, chunk_size=1 << 20):
+        "(node, value) of the worst leaf, scanning the leaf rewards chunk by chunk"
+        return self._extreme_leaf(np.argmin, chunk_size)
+
+
+class ImplicitNode:
+    "Node of an `ImplicitBinaryTree`, with the same interface as `Node`"
+    __slots__ = ("tree", "level", "index")
+
+    def __init__(self, tree, level, index):
+        self.tree = tree
+        self.level = level
+        self.index = index
+
+    @property
+    def node_id(self):
+        return str(self.level) + "_" + str(self.index)
+
+    @property
+    def value(self):
+        return self.reward()
+
+    def __repr__(self):
+        return "node@" + self.node_id
+
+    def __str__(self):
+        return "node@" + self.node_id
+
+    def __eq__(self, other):
+        return (isinstance(other, ImplicitNode) and self.tree is other.tree
+                and self.level == other.level and self.index == other.index)
+
+    def __hash__(self):
+        return hash((self.level, self.index))
+
+    def is_terminal(self):
+        return self.level == self.tree.depth
+
+    def find_children(self):
+        if self.is_terminal():
+            return {}
+        return set(self.find_children_list())
+
+    def find_children_list(self):
+        """This makes sure left, right order instead of an unsorted set"""
+        if self.is_terminal():
+            return []
+        return [ImplicitNode(self.tree, self.level + 1, 2 * self.index),
+                ImplicitNode(self.tree, self.level + 1, 2 * self.index + 1)]
+
+    def find_random_child(self):
+        if self.is_terminal():
+            return None
+        return ImplicitNode(self.tree, self.level + 1, 2 * self.index + choice([0, 1]))
+
+    def reward(self):
+        if not self.is_terminal():
+            return None
+        return self.tree.leaf_reward(self.index)
+
+    def sample_terminal_descendant(self):
+        "Random leaf below this node, drawing all left/right turns as one random number"
+        height = self.tree.depth - self.level
+        return self.tree.leaf((self.index << height) + random.getrandbits(height))
+
+    def sample_terminal_rewards(self, size):
+        "Rewards of `size` random leaves below this node, as an array"
+        height = self.tree.depth - self.level
+        return self.tree.leaf_rewards((self.index << height) + np.random.randint(0, 2 ** height, size))
+
+
+def make_implicit_binary_tree(depth=12, seed=None, rewards_path=None):
+    """Root of an `ImplicitBinaryTree`.
+
+    Without `rewards_path` the leaf rewards are hashed from `seed`, which is drawn from `random` when
+    not given. Otherwise `rewards_path` is a raw float64 file of 2^depth leaf rewards, memory-mapped read-only.
+    """
+    if seed is None:
+        seed = random.getrandbits(64)
+    rewards = None
+    if rewards_path is not None:
+        rewards = np.memmap(rewards_path, dtype=np.float64, mode="r")
+    return ImplicitBinaryTree(depth=depth, seed=seed, rewards=rewards).root
@@ -0,0 +1,168 @@
+"""
+Binary checkpoints of search trees and tabular Q/V values.
+
+A tree checkpoint is a directory of .npy files: the sorted node keys, N and Q of every node and
+the child links as ranges of ids into `child_ids`, in the layout of `ArrayMCTS`. Node ids are
+positions in the sorted keys, so a loaded checkpoint finds nodes by binary search on the keys
+and never builds a dict. `TreeCheckpoint` opens the arrays memory-mapped and read-only, worker
+processes loading the same checkpoint share its pages instead of copying it.
+"""
+from collections import deque
+import os
+
+import numpy as np
+
+from monte_carlo_tree_search import ArrayMCTS, TranspositionMCTS
+
+TREE_ARRAYS = ["keys", "N", "Q", "child_start", "child_count", "child_ids"]
+
+
+def _entries(mcts):
+    "Dict of item -> (N, Q, children or None) of a searcher, items are nodes or transposition keys"
+    entries = {}
+    if isinstance(mcts, ArrayMCTS):
+        for i, node in enumerate(mcts.nodes):
+            expanded = mcts.child_start[i] >= 0
+            children = [mcts.nodes[j] for j in mcts.children_of(i)] if expanded else None
+            entries[node] = (mcts.N[i], mcts.Q[i], children)
+        return entries
+    if isinstance(mcts, TranspositionMCTS):
+        children = {k: [mcts.key(c) for c in cs] for k, cs in mcts.children.items()}
+    else:
+        children = {node: list(cs) for node, cs in mcts.children.items()}
+    for item in mcts.N.keys() | children.keys() | {c for cs in children.values() for c in cs}:
+        entries[item] = (mcts.N.get(item, 0.0), mcts.Q.get(item, 0.0), children.get(item))
+    return entries
+
+
+def save_tree(path, mcts, key=str):
+    """Save the statistics and child links of `mcts` into the directory `path`.
+
+    `key` maps a node (for `TranspositionMCTS` a state key) to a str or int that is unique in
+    the tree and stable across processes, the default str suits the binary tree nodes.
+    """
+    entries = _entries(mcts)
+    items = list(entries)
+    keys = np.array([key(item) for item in items])
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    if len(keys) > 1 and (keys[1:] == keys[:-1]).any():
+        raise ValueError("save_tree needs a key that is unique for every node")
+    ids = {items[j]: i for i, j in enumerate(order)}
+    N, Q = np.zeros(len(items)), np.zeros(len(items))
+    child_start = np.full(len(items), -1, dtype=np.int64)
+    child_count = np.zeros(len(items), dtype=np.int64)
+    child_ids = []
+    for i, j in enumerate(order):
+        N[i], Q[i], children = entries[items[j]]
+        if children is not None:
+            child_start[i] = len(child_ids)
+            child_count[i] = len(children)
+            child_ids.extend(ids[c] for c in children)
+    os.makedirs(path, exist_ok=True)
+    arrays = dict(keys=keys, N=N, Q=Q, child_start=child_start, child_count=child_count,
+                  child_ids=np.array(child_ids, dtype=np.int64))
+    for name in TREE_ARRAYS:
+        np.save(os.path.join(path, name + ".npy"), arrays[name])
+
+
+class TreeCheckpoint:
+    "Read-only view of a tree saved with `save_tree`, memory-mapped unless `mmap` is False"
+
+    def __init__(self, path, mmap=True):
+        for name in TREE_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, k):
+        return self.index(k) is not None
+
+    def index(self, k):
+        "Id of the node with key k, None if the checkpoint does not hold it"
+        i = int(np.searchsorted(self.keys, k))
+        if i < len(self.keys) and self.keys[i] == k:
+            return i
+        return None
+
+    def is_expanded(self, i):
+        return self.child_start[i] >= 0
+
+    def children(self, i):
+        "Array of child ids of the node id i, empty for nodes that were not expanded"
+        start = self.child_start[i]
+        if start < 0:
+            return self.child_ids[:0]
+        return self.child_ids[start:start + self.child_count[i]]
+
+    def stats(self, k):
+        "(N, Q) of the node with key k, zeros for unknown nodes"
+        i = self.index(k)
+        if i is None:
+            return 0.0, 0.0
+        return float(self.N[i]), float(self.Q[i])
+
+
+def _stat_key(mcts, node):
+    "Key of node in the statistics of a searcher"
+    if isinstance(mcts, ArrayMCTS):
+        return mcts.node_id(node)
+    if isinstance(mcts, TranspositionMCTS):
+        return mcts.key(node)
+    return node
+
+
+def _expanded_children(mcts, node):
+    if isinstance(mcts, ArrayMCTS):
+        return [mcts.nodes[j] for j in mcts.children_of(mcts.node_id(node))]
+    return mcts.children[_stat_key(mcts, node)]
+
+
+def warm_start(mcts, checkpoint, root, key=str, max_depth=None):
+    """Add the statistics saved in `checkpoint` for the subtree below `root` to `mcts`.
+
+    The subtree is walked breadth first from `root` down to `max_depth` levels, nodes expanded in
+    the checkpoint are expanded in `mcts`. Only the visited part of the checkpoint is read.
+    Every statistics key is applied once, states of a `TranspositionMCTS` reachable by several
+    paths are not walked again. Returns the number of nodes whose statistics were found.
+    """
+    found = 0
+    frontier = deque([(root, 0)])
+    seen = {_stat_key(mcts, root)}
+    while frontier:
+        node, depth = frontier.popleft()
+        stat_key = _stat_key(mcts, node)
+        i = checkpoint.index(key(stat_key if isinstance(mcts, TranspositionMCTS) else node))
+        if i is None:
+            continue
+        found += 1
+        mcts.N[stat_key] += checkpoint.N[i]
+        mcts.Q[stat_key] += checkpoint.Q[i]
+        if checkpoint.is_expanded(i) and (max_depth is None or depth < max_depth):
+            mcts.expand(node)
+            for child in _expanded_children(mcts, node):
+                child_key = _stat_key(mcts, child)
+                if child_key not in seen:
+                    seen.add(child_key)
+                    frontier.append((child, depth + 1))
+    return found
+
+
+def save_table(path, table):
+    """Save a Q table (array, list of rows or Q[s][a] mapping) or a V table (array or V[s] mapping) as .npy.
+
+    States and actions of mappings must be 0 .. n - 1, as in the tables of this repo.
+    """
+    if isinstance(table, dict):
+        states = sorted(table)
+        if states != list(range(len(states))):
+            raise ValueError("save_table needs the states 0 .. n - 1")
+        table = [[row[a] for a in sorted(row)] if isinstance(row, dict) else row
+                 for row in (table[s] for s in states)]
+    np.save(path, np.asarray(table, dtype=float))
+
+
+def load_table(path, mmap=True):
+    "Array saved with `save_table`, memory-mapped read-only unless `mmap` is False"
+    return np.load(path, mmap_mode="r" if mmap else None)
@@ -0,0 +1,115 @@
+"""
+Exact dynamic programming solvers over the model of a DiscreteEnv, as batched NumPy backups.
+
+`tabular.compile_model` turns all `(prob, next_state, reward, done)` outcomes of `env.P[s][a]`
+into (nS, nA, K) arrays padded with zero probability outcomes, K being the largest number of
+outcomes of an action. A backup of every state and action is then a single expression over these
+arrays. Episodes end in terminal states and on done transitions, which contribute no future
+value, like in the learners of this repo. The default discount factor 1.0 matches them as well.
+"""
+from collections import namedtuple
+import argparse
+import time
+
+import numpy as np
+
+from gridworld import MapGridworldEnv, random_layout
+from tabular import compile_model
+
+# result of a solver, `iterations` counts the sweeps over all states
+Solution = namedtuple("Solution", ["V", "Q", "policy", "iterations"])
+
+
+def q_from_v(model, V, discount_factor=1.0):
+    "Action values of every state given the state values V, zero in terminal states"
+    Q = (model.prob * (model.reward + discount_factor * np.where(model.done, 0.0, V[model.next_state]))).sum(axis=2)
+    Q[model.terminal] = 0.0
+    return Q
+
+
+def _policy_matrix(policy, nA):
+    "(nS, nA) action probabilities of a policy given as actions per state or as probabilities"
+    policy = np.asarray(policy)
+    if policy.ndim == 2:
+        return policy
+    return np.eye(nA)[policy]
+
+
+def policy_evaluation(env, policy, discount_factor=1.0, tol=1e-8, max_iter=100000, V=None):
+    """State values of `policy`, an (nS,) array of actions or an (nS, nA) array of probabilities.
+
+    Sweeps until no value changes more than `tol`, or `max_iter` sweeps, starting from V (zeros by
+    default). Returns (V, number of sweeps). With discount factor 1.0 the policy must end the
+    episodes, otherwise the values of states it never leaves keep decreasing until `max_iter`.
+    """
+    model = compile_model(env)
+    pi = _policy_matrix(policy, model.prob.shape[1])
+    V = np.zeros(len(model.terminal)) if V is None else np.array(V, dtype=float)
+    for i in range(1, max_iter + 1):
+        V_new = (pi * q_from_v(model, V, discount_factor)).sum(axis=1)
+        delta = np.abs(V_new - V).max()
+        V = V_new
+        if delta < tol:
+            break
+    return V, i
+
+
+def value_iteration(env, discount_factor=1.0, tol=1e-8, max_iter=100000, V=None):
+    "Optimal values and greedy policy by value iteration, warm-started from V (zeros by default)"
+    model = compile_model(env)
+    V = np.zeros(len(model.terminal)) if V is None else np.array(V, dtype=float)
+    for i in range(1, max_iter + 1):
+        Q = q_from_v(model, V, discount_factor)
+        V_new = Q.max(axis=1)
+        delta = np.abs(V_new - V).max()
+        V = V_new
+        if delta < tol:
+            break
+    Q = q_from_v(model, V, discount_factor)
+    return Solution(V, Q, Q.argmax(axis=1), i)
+
+
+def policy_iteration(env, discount_factor=1.0, tol=1e-8, max_iter=100000, policy=None, V=None, eval_iter=5):
+    """Optimal values and policy by policy iteration, warm-started from a policy and/or values.
+
+    Without a policy the first one is greedy with respect to V. Every evaluation starts from the
+    values of the previous policy and runs at most `eval_iter` sweeps (modified policy iteration),
+    so policies that never end an episode, e.g. the first one with discount factor 1.0, are
+    improved after a bounded number of sweeps instead of being evaluated until `max_iter`.
+    `iterations` of the result counts evaluation sweeps.
+    """
+    model = compile_model(env)
+    nS = len(model.terminal)
+    V = np.zeros(nS) if V is None else np.array(V, dtype=float)
+    if policy is None:
+        policy = q_from_v(model, V, discount_factor).argmax(axis=1)
+    policy = np.asarray(policy)
+    sweeps = 0
+    for _ in range(max_iter):
+        V, n = policy_evaluation(model, policy, discount_factor, tol=tol, max_iter=eval_iter, V=V)
+        sweeps += n
+        Q = q_from_v(model, V, discount_factor)
+        # keep the current action on ties, so the iteration stops instead of cycling between equal actions
+        current = Q[np.arange(nS), policy]
+        improved = np.where(Q.max(axis=1) > current + tol, Q.argmax(axis=1), policy)
+        if (improved == policy).all() and n == 1:
+            break
+        policy = improved
+    return Solution(V, Q, policy, sweeps)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='solve a random map gridworld exactly')
+    parser.add_argument("--size", type=int, default=100, help="number of rows and columns of the map")
+    parser.add_argument("--wall_fraction", type=float, default=0.2, help="fraction of wall cells")
+    parser.add_argument("--discount_factor", type=float, default=1.0, help="discount factor")
+    parser.add_argument("--tol", type=float, default=1e-8, help="convergence tolerance")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the map")
+    args = parser.parse_args()
+    env = MapGridworldEnv(random_layout((args.size, args.size), wall_fraction=args.wall_fraction, seed=args.seed))
+    model = compile_model(env)
+    for name, solver in [("value iteration", value_iteration), ("policy iteration", policy_iteration)]:
+        start = time.perf_counter()
+        solution = solver(model, discount_factor=args.discount_factor, tol=args.tol)
+        print("{}: {} sweeps in {:.3f}s, mean V {:.3f}".format(name, solution.iterations, time.perf_counter() - start,
+                                                              solution.V[~model.terminal].mean()))
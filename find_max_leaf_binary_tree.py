@@ -1,26 +1,68 @@
-from binary_tree import make_binary_tree
-from monte_carlo_tree_search import MCTS
+from binary_tree import make_binary_tree, make_implicit_binary_tree
+from monte_carlo_tree_search import MCTS, ArrayMCTS, ProgressiveWideningMCTS, SolverMCTS
+from mcts_profiler import MCTSProfiler
+from parallel_mcts import RootParallelMCTS, TreeParallelMCTS
 import argparse
 
 
-def mcts_playout(depth, num_iter, num_rollout, exploration_weight):
-    root, leaf_nodes_dict = make_binary_tree(depth=depth)
-    leaf_nodes_dict_sorted = sorted(leaf_nodes_dict.items(), key=lambda x: x[1], reverse=True)
-    print("Expected (max) leaf node: {}, value: {}".format(leaf_nodes_dict_sorted[0][0],
-                                                           leaf_nodes_dict_sorted[0][1]))
-    print("Expected (min) leaf node: {}, value: {}".format(leaf_nodes_dict_sorted[-1][0],
-                                                           leaf_nodes_dict_sorted[-1][1]))
+def mcts_playout(depth, num_iter, num_rollout, exploration_weight, store="dict", parallel=None, num_workers=None,
+                 batch_size=None, implicit=False, max_time=None, max_nodes=None,
+                 profile=False, widening_exponent=None, solver=False):
+    if implicit:
+        # nodes are only created when the search reaches them
+        root = make_implicit_binary_tree(depth=depth)
+        max_leaf, min_leaf = root.tree.max_leaf(), root.tree.min_leaf()
+    else:
+        root, leaf_nodes_dict = make_binary_tree(depth=depth)
+        leaf_nodes_dict_sorted = sorted(leaf_nodes_dict.items(), key=lambda x: x[1], reverse=True)
+        max_leaf, min_leaf = leaf_nodes_dict_sorted[0], leaf_nodes_dict_sorted[-1]
+    print("Expected (max) leaf node: {}, value: {}".format(max_leaf[0], max_leaf[1]))
+    print("Expected (min) leaf node: {}, value: {}".format(min_leaf[0], min_leaf[1]))
 
-    mcts = MCTS(exploration_weight=exploration_weight)
+    if parallel == "root":
+        mcts = RootParallelMCTS(root, exploration_weight=exploration_weight, num_workers=num_workers)
+    elif parallel == "tree":
+        mcts = TreeParallelMCTS(exploration_weight=exploration_weight)
+    elif store == "array":
+        mcts = ArrayMCTS(exploration_weight=exploration_weight)
+    elif solver:
+        mcts = SolverMCTS(exploration_weight=exploration_weight)
+    elif widening_exponent is not None:
+        mcts = ProgressiveWideningMCTS(exploration_weight=exploration_weight, widening_exponent=widening_exponent)
+    else:
+        mcts = MCTS(exploration_weight=exploration_weight)
+    profiler = MCTSProfiler(mcts) if profile and parallel is None else None
     while True:
         # we run MCTS simulation for many times
-        for _ in range(num_iter):
-            mcts.run(root, num_rollout=num_rollout)
+        if parallel == "root":
+            mcts.run_parallel(root, num_iter, num_rollout)
+        elif parallel == "tree":
+            mcts.run_parallel(root, num_iter, num_rollout, num_workers=num_workers)
+        elif max_time is not None or max_nodes is not None:
+            # num_iter, max_time and max_nodes bound every move, whichever is used up first
+            mcts.search(root, num_rollout=num_rollout, max_iter=num_iter, max_time=max_time, max_nodes=max_nodes)
+        elif batch_size:
+            for i in range(0, num_iter, batch_size):
+                if solver and mcts.is_proven(root):
+                    break
+                mcts.run_batch(root, num_rollout=num_rollout, batch_size=min(batch_size, num_iter - i))
+        else:
+            for _ in range(num_iter):
+                if solver and mcts.is_proven(root):
+                    break  # the best move is known exactly, further iterations would not change it
+                mcts.run(root, num_rollout=num_rollout)
         # we choose the best greedy action based on simulation results
         root = mcts.choose(root)
+        # the statistics of the siblings of the chosen move are not needed anymore
+        mcts.advance_root(root)
         # we repeat until root is terminal
         if root.is_terminal():
+            if parallel == "root":
+                mcts.close()
             print("Found optimal (max) leaf node: {}, value: {}".format(root, root.value))
+            if profiler is not None:
+                profiler.detach()
+                print("Profile: {}".format(profiler.summary()))
             return root.value
 
 
@@ -31,5 +73,36 @@ if __name__ == '__main__':
     parser.add_argument("--num_rollout", type=int, default=1, help="number of rollout simulations in a MCTS iteration")
     parser.add_argument("--depth", type=int, default=12, help="number of depth of the binary tree")
     parser.add_argument("--exploration_weight", type=float, default=51, help="exploration weight, c number in UCT")
+    parser.add_argument("--store", choices=["dict", "array"], default="dict",
+                        help="keep node statistics in dicts keyed by node or in NumPy arrays indexed by node id")
+    parser.add_argument("--parallel", choices=["root", "tree"], default=None,
+                        help="root parallel search over processes or tree parallel search over threads")
+    parser.add_argument("--num_workers", type=int, default=None, help="number of processes/threads, default all cores")
+    parser.add_argument("--batch_size", type=int, default=None,
+                        help="number of leaves selected and evaluated together, num_iter counts leaves")
+    parser.add_argument("--implicit", action="store_true",
+                        help="use an implicit binary tree whose nodes are created on demand, for large depths")
+    parser.add_argument("--max_time", type=float, default=None,
+                        help="wall-clock budget in seconds for the iterations of every move")
+    parser.add_argument("--max_nodes", type=int, default=None,
+                        help="stop iterating once the tree holds this many nodes")
+    parser.add_argument("--profile", action="store_true",
+                        help="time the select/expand/simulate/backup phases and count nodes and rollouts")
+    parser.add_argument("--widening_exponent", type=float, default=None,
+                        help="use progressive widening, a node visited N times considers N ** exponent children")
+    parser.add_argument("--solver", action="store_true",
+                        help="prove exact values of exhausted subtrees and stop iterating once the root is proven")
     args = parser.parse_args()
-    mcts_playout(args.depth, args.num_iter, args.num_rollout, args.exploration_weight)
+    if args.solver:
+        # the other searchers keep no proofs, and search() does not stop at a proven root
+        others = {"--store array": args.store == "array", "--parallel": args.parallel is not None,
+                  "--max_time": args.max_time is not None,
+                  "--max_nodes": args.max_nodes is not None, "--widening_exponent": args.widening_exponent is not None}
+        conflicts = [option for option, used in others.items() if used]
+        if conflicts:
+            parser.error("--solver cannot be combined with {}".format(", ".join(conflicts)))
+    mcts_playout(args.depth, args.num_iter, args.num_rollout, args.exploration_weight, store=args.store,
+                 parallel=args.parallel, num_workers=args.num_workers, batch_size=args.batch_size,
+                 implicit=args.implicit, max_time=args.max_time, max_nodes=args.max_nodes,
+                 profile=args.profile, widening_exponent=args.widening_exponent,
+                 solver=args.solver)
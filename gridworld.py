@@ -1,9 +1,14 @@
-import sys
+from collections.abc import Mapping
 from io import StringIO
+import hashlib
+import os
+import sys
 
 from gym.envs.toy_text import discrete
 import numpy as np
 
+from tabular import Model, Transitions, compile_model
+
 UP = 0
 RIGHT = 1
 DOWN = 2
@@ -54,28 +59,29 @@ class GridworldEnv(discrete.DiscreteEnv):
         grid = np.arange(nS).reshape(shape)
         it = np.nditer(grid, flags=['multi_index'])
 
+        # wall points from (2, 3..7), (3..6, 7), (8, 2..5)
+        # these are corresponding to states according to s = 9*(r-1) + c-1
+        self.wall_states = set()
+        # for g in [[[2], [3, 4,5,6,7]], [[3,4,5,6], [7]], [[8], [2,3,4,5]]]:
+        for c in [3, 4, 5, 6, 7]:
+            temp = 9 * (2 - 1) + c - 1
+            self.wall_states.add(temp)
+        for r in [3, 4, 5, 6]:
+            temp = 9 * (r - 1) + 7 - 1
+            self.wall_states.add(temp)
+        for c in [2, 3, 4, 5]:
+            temp = 9 * (8 - 1) + c - 1
+            self.wall_states.add(temp)
+
+        self.snake_pit_state = 9 * 6 + 5  # 59
+        self.treasure_state = 9 * 8 + 8  # 80
+
         while not it.finished:
             s = it.iterindex
             y, x = it.multi_index
 
             P[s] = {a: [] for a in range(nA)}
 
-            # wall points from (2, 3..7), (3..6, 7), (8, 2..5)
-            # these are corresponding to states according to s = 9*(r-1) + c-1
-            self.wall_states = []
-            # for g in [[[2], [3, 4,5,6,7]], [[3,4,5,6], [7]], [[8], [2,3,4,5]]]:
-            for c in [3, 4, 5, 6, 7]:
-                temp = 9 * (2 - 1) + c - 1
-                self.wall_states.append(temp)
-            for r in [3, 4, 5, 6]:
-                temp = 9 * (r - 1) + 7 - 1
-                self.wall_states.append(temp)
-            for c in [2, 3, 4, 5]:
-                temp = 9 * (8 - 1) + c - 1
-                self.wall_states.append(temp)
-
-            self.snake_pit_state = 9 * 6 + 5  # 59
-            self.treasure_state = 9 * 8 + 8  # 80
             if s == self.snake_pit_state:
                 reward = -50.0
             elif s == self.treasure_state:
@@ -192,7 +198,9 @@ class GridworldEnv(discrete.DiscreteEnv):
                 output = " W "
             else:
                 # output = " o "
-                best_action = max(Q[s].items(), key=lambda a: a[1])[0]
+                # Q[s] maps actions to values, or is a row of values indexed by action
+                q = Q[s]
+                best_action = max(q.items(), key=lambda a: a[1])[0] if isinstance(q, dict) else int(np.argmax(q))
                 output = ARROWS[best_action]
 
             if x == 0:
@@ -206,4 +214,176 @@ class GridworldEnv(discrete.DiscreteEnv):
                 outfile.write("\n")
 
             it.iternext()
-        print("\n")
\ No newline at end of file
+        print("\n")
+
+
+# the layout hard-coded in GridworldEnv as a map, W wall, P snake pit, T treasure
+GRIDWORLD_9X9 = """\
+.........
+..WWWWW..
+......W..
+......W..
+......W..
+......W..
+.....P...
+.WWWW....
+........T
+"""
+
+# map characters of MapGridworldEnv
+FREE = ".o"
+WALL = "W#"
+PIT = "P"
+GOAL = "TG"
+
+
+def parse_layout(layout):
+    "Array of single characters from a map given as text, a list of rows or an array"
+    if isinstance(layout, np.ndarray):
+        return layout.astype("U1")
+    if isinstance(layout, str):
+        layout = layout.split()
+    rows = [row.strip() for row in layout if row.strip()]
+    if len({len(row) for row in rows}) != 1:
+        raise ValueError("all rows of the map must have the same length")
+    return np.array(rows).view("U1").reshape(len(rows), len(rows[0]))
+
+
+def random_layout(shape, wall_fraction=0.2, num_pits=1, seed=None):
+    """Procedurally generated map with random walls, `num_pits` pits and a treasure in the bottom right corner.
+
+    Free cells from which no terminal state can be reached become walls, so every episode can end.
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.where(rng.random(shape) < wall_fraction, WALL[0], FREE[0])
+    grid[-1, -1] = GOAL[0]
+    free = np.flatnonzero(grid.ravel() == FREE[0])
+    grid.ravel()[rng.choice(free, size=num_pits, replace=False)] = PIT
+    # grow the set of cells that reach a terminal state one step at a time
+    reach = grid != FREE[0]
+    reach &= grid != WALL[0]
+    open_cells = grid != WALL[0]
+    while True:
+        neighbour = np.zeros_like(reach)
+        neighbour[1:] |= reach[:-1]
+        neighbour[:-1] |= reach[1:]
+        neighbour[:, 1:] |= reach[:, :-1]
+        neighbour[:, :-1] |= reach[:, 1:]
+        grown = reach | (neighbour & open_cells)
+        if (grown == reach).all():
+            break
+        reach = grown
+    grid[open_cells & ~reach] = WALL[0]
+    return ["".join(row) for row in grid]
+
+
+def compile_layout(grid, step_reward=-1.0, pit_reward=-50.0, goal_reward=50.0):
+    """Transitions of a map, computed for all states at once.
+
+    Moving off the grid or into a wall from outside leaves you in your current state. Entering a pit or a goal
+    gives its reward and ends the episode, both are absorbing. Every other step gives `step_reward`.
+    """
+    height, width = grid.shape
+    cells = grid.ravel()
+    wall = np.isin(cells, list(WALL))
+    terminal = np.isin(cells, list(PIT + GOAL))
+    cell_reward = np.where(np.isin(cells, list(PIT)), pit_reward, goal_reward)
+    states = np.arange(height * width)
+    y, x = np.divmod(states, width)
+
+    next_state = np.empty((len(states), 4), dtype=np.int64)
+    for a, (dy, dx) in {UP: (-1, 0), RIGHT: (0, 1), DOWN: (1, 0), LEFT: (0, -1)}.items():
+        inside = (y + dy >= 0) & (y + dy < height) & (x + dx >= 0) & (x + dx < width)
+        target = np.where(inside, states + dy * width + dx, states)
+        # like the hard-coded layout, walls can be left (you can start in them) but not entered
+        next_state[:, a] = np.where(inside & (~wall[target] | wall), target, states)
+    next_state[terminal] = states[terminal, None]
+
+    entered = terminal[next_state] & (next_state != states[:, None])
+    reward = np.where(entered, cell_reward[next_state], step_reward)
+    reward[terminal] = cell_reward[terminal, None]
+    done = terminal[next_state]
+    return Transitions(next_state, reward, done, terminal), wall
+
+
+def slippery_model(transitions, slip):
+    """Model in which an action moves as intended with probability 1 - slip, otherwise to either side.
+
+    Each perpendicular move has probability slip / 2, terminal states stay absorbing.
+    """
+    actions = np.arange(4)
+    # intended action, then the ones 90 degrees clockwise and counterclockwise of it
+    moves = np.stack([actions, (actions + 1) % 4, (actions + 3) % 4], axis=1)
+    T = transitions
+    prob = np.broadcast_to([1.0 - slip, slip / 2, slip / 2], T.reward.shape + (3,)).copy()
+    return Model(prob, T.next_state[:, moves], T.reward[:, moves], T.done[:, moves], T.terminal)
+
+
+class TransitionTable(Mapping):
+    "Read-only `P[s][a] = [(prob, next_state, reward, done), ...]` view of a compiled model, built on access"
+
+    def __init__(self, model):
+        self.model = model
+        self._rows = {}
+
+    def __getitem__(self, s):
+        row = self._rows.get(s)
+        if row is None:
+            if not 0 <= s < len(self):
+                raise KeyError(s)
+            m = self.model
+            row = {a: [(float(p), int(n), float(r), bool(d))
+                       for p, n, r, d in zip(m.prob[s, a], m.next_state[s, a], m.reward[s, a], m.done[s, a]) if p > 0]
+                   for a in range(m.prob.shape[1])}
+            self._rows[s] = row
+        return row
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __len__(self):
+        return len(self.model.terminal)
+
+
+class MapGridworldEnv(GridworldEnv):
+    """Grid world built from a map instead of the hard-coded 9x9 layout.
+
+    Each row of the map is a row of the grid: '.' or 'o' free, 'W' or '#' wall, 'P' snake pit
+    and 'T' or 'G' treasure. Transitions are compiled for all states at once and kept in
+    `transitions`, `P` is a view built on access. With `cache_dir` the compiled transitions
+    are stored there, keyed by a hash of the map and the rewards, and loaded on the next start.
+    With `slip` the world is slippery: `transitions` still hold the intended moves, `model` and
+    `P` all outcomes, see `slippery_model`.
+    """
+
+    def __init__(self, layout=GRIDWORLD_9X9, step_reward=-1.0, pit_reward=-50.0, goal_reward=50.0,
+                 cache_dir=None, slip=0.0):
+        grid = parse_layout(layout)
+        self.shape = list(grid.shape)
+        rewards = (step_reward, pit_reward, goal_reward)
+
+        cache_path = None
+        if cache_dir is not None:
+            key = hashlib.sha1(grid.tobytes() + str((grid.shape, rewards)).encode()).hexdigest()
+            cache_path = os.path.join(cache_dir, "gridworld_{}.npz".format(key))
+        if cache_path is not None and os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                self.transitions = Transitions(*(cached[name] for name in Transitions._fields))
+                wall = cached["wall"]
+        else:
+            self.transitions, wall = compile_layout(grid, *rewards)
+            if cache_path is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.savez(cache_path, wall=wall, **self.transitions._asdict())
+
+        self.wall_states = set(np.flatnonzero(wall).tolist())
+        self.terminal_states = set(np.flatnonzero(self.transitions.terminal).tolist())
+        nS = grid.size
+        # Initial state distribution is uniform
+        isd = np.ones(nS) / nS
+        self.model = slippery_model(self.transitions, slip) if slip else compile_model(self)
+        self.P = TransitionTable(self.model)
+        discrete.DiscreteEnv.__init__(self, nS, 4, self.P, isd)
+
+    def is_terminal(self, s):
+        return s in self.terminal_states
@@ -0,0 +1,132 @@
+import argparse
+from random import choice
+
+import numpy as np
+
+from gridworld import GridworldEnv
+from monte_carlo_tree_search import TranspositionMCTS
+from tabular import TransitionSampler
+
+
+class GridworldNode:
+    """A GridworldEnv episode as a search node: current state, steps left and reward collected so far.
+
+    Nodes reached by different paths are different objects, `state_key` identifies the ones that
+    share the same future so `TranspositionMCTS` can merge them. Counting down the steps left
+    keeps the search graph acyclic although the gridworld itself has self-loops. Moves draw their
+    outcome from `sampler`, shared by all nodes of a search. On deterministic maps the children are
+    the next nodes, on slippery maps they are `GridworldAction` chance nodes, so the searcher picks
+    an action and the sampler its outcome.
+    """
+
+    def __init__(self, env, state, steps_left, total_reward=0.0, sampler=None):
+        self.env = env
+        self.state = state
+        self.steps_left = steps_left
+        self.total_reward = total_reward
+        self.sampler = TransitionSampler(env) if sampler is None else sampler
+
+    def __repr__(self):
+        return "state@{}({} steps left)".format(self.state, self.steps_left)
+
+    def is_terminal(self):
+        return self.steps_left == 0 or self.env.is_terminal(self.state)
+
+    def step(self, action):
+        next_state, reward, _ = self.sampler.step(self.state, action)
+        return self.outcome(next_state, reward)
+
+    def outcome(self, next_state, reward):
+        return GridworldNode(self.env, next_state, self.steps_left - 1, self.total_reward + reward, self.sampler)
+
+    def move(self, action):
+        "Child of taking action, a chance node unless the map is deterministic"
+        if self.sampler.deterministic:
+            return self.step(action)
+        return GridworldAction(self, action)
+
+    def find_children(self):
+        if self.is_terminal():
+            return {}
+        return {self.move(a) for a in range(self.env.nA)}
+
+    def find_random_child(self):
+        if self.is_terminal():
+            return None
+        return self.move(choice(range(self.env.nA)))
+
+    def reward(self):
+        return self.total_reward
+
+
+class GridworldAction:
+    "Chance node of a slippery map: an action taken in a node, whose outcome is drawn on every visit"
+
+    def __init__(self, node, action):
+        self.node = node
+        self.action = action
+        self.state = node.state
+        self.steps_left = node.steps_left
+
+    def __repr__(self):
+        return "{}->{}".format(self.node, self.action)
+
+    def is_chance(self):
+        return True
+
+    def is_terminal(self):
+        return False
+
+    def find_children(self):
+        "Every possible outcome of the action, one per next state"
+        m = self.node.sampler.model
+        s, a = self.state, self.action
+        outcomes = {int(m.next_state[s, a, k]): float(m.reward[s, a, k]) for k in np.flatnonzero(m.prob[s, a] > 0)}
+        return {self.node.outcome(next_state, reward) for next_state, reward in outcomes.items()}
+
+    def find_random_child(self):
+        return self.node.step(self.action)
+
+    def reward(self):
+        raise RuntimeError("reward called on chance node {}".format(self))
+
+
+def state_key(node):
+    if isinstance(node, GridworldAction):
+        return node.state, node.steps_left, node.action
+    return node.state, node.steps_left
+
+
+def mcts_gridworld(env, start_state, horizon, num_iter, num_rollout, exploration_weight, max_size=None,
+                   eviction="lru"):
+    node = GridworldNode(env, start_state, horizon)
+    mcts = TranspositionMCTS(state_key, exploration_weight=exploration_weight, max_size=max_size,
+                             eviction=eviction)
+    path = [node.state]
+    while not node.is_terminal():
+        for _ in range(num_iter):
+            mcts.run(node, num_rollout=num_rollout)
+        node = mcts.choose(node)
+        if isinstance(node, GridworldAction):
+            node = node.find_random_child()  # the chosen action slips or not
+        mcts.advance_root(node)
+        path.append(node.state)
+    print("Visited states: {}".format(path))
+    print("Return: {}, table size: {}, evicted: {}".format(node.total_reward, len(mcts.children),
+                                                           mcts.num_evicted))
+    return node.total_reward
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MCTS with a transposition table on the gridworld')
+    parser.add_argument("--start_state", type=int, default=0, help="state the episode starts in")
+    parser.add_argument("--horizon", type=int, default=40, help="maximum number of steps of an episode")
+    parser.add_argument("--num_iter", type=int, default=200, help="number of MCTS iterations before each move")
+    parser.add_argument("--num_rollout", type=int, default=1, help="number of rollout simulations in a MCTS iteration")
+    parser.add_argument("--exploration_weight", type=float, default=50, help="exploration weight, c number in UCT")
+    parser.add_argument("--max_size", type=int, default=None, help="maximum number of states kept in the table")
+    parser.add_argument("--eviction", choices=["lru", "visits"], default="lru", help="which states to evict first")
+    args = parser.parse_args()
+    env = GridworldEnv((9, 9))
+    mcts_gridworld(env, args.start_state, args.horizon, args.num_iter, args.num_rollout, args.exploration_weight,
+                   max_size=args.max_size, eviction=args.eviction)
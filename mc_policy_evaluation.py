@@ -4,6 +4,7 @@ from random import choice
 import numpy as np
 
 from gridworld import GridworldEnv
+from tabular import TransitionSampler, compile_transitions
 
 
 def mc_policy_evaluation_random_policy(env, num_episodes=1000):
@@ -11,15 +12,17 @@ def mc_policy_evaluation_random_policy(env, num_episodes=1000):
     V = defaultdict(float)
     for _s in env.P:
         V[_s] = 0.0
-    returns = defaultdict(list)  # an empty list for each state
+    counts = defaultdict(int)  # number of returns averaged into V for each state
+    states = list(env.P.keys())
+    actions = {s: list(env.P[s].keys()) for s in states}
+    sampler = TransitionSampler(env)  # draws one of the outcomes of P[s][a] by its probability
     for i in range(num_episodes):
         episodes = []
-        init_state = choice(list(set(env.P.keys())))  # draw a random state to start
+        init_state = choice(states)  # draw a random state to start
         # generate an episode
         while not env.is_terminal(init_state):
-            action = choice(list(env.P[init_state].keys()))  # random policy such that draw an action randomly
-            next_state = env.P[init_state][action][0][1]
-            reward = env.P[init_state][action][0][2]
+            action = choice(actions[init_state])  # random policy such that draw an action randomly
+            next_state, reward, _ = sampler.step(init_state, action)
             episodes.append([init_state, action, reward])
             init_state = next_state
         G = 0
@@ -28,12 +31,122 @@ def mc_policy_evaluation_random_policy(env, num_episodes=1000):
             G = 1.0 * G + R  # assuming discount factor is 1.0
             if S not in states_seen:
                 states_seen.add(S)
-                returns[S].append(G)
-                V[S] = np.mean(returns[S])
+                # incremental mean instead of keeping every return
+                counts[S] += 1
+                V[S] += (G - V[S]) / counts[S]
     V_sorted = sorted(V.items(), key=lambda x: x[0])  # sort by state
     return V_sorted
 
 
+class StreamingMCEvaluator:
+    """Monte Carlo evaluation of the random policy with constant memory, undiscounted like above.
+
+    Only running counts, sums and sums of squares of the returns of every state are kept, so
+    episodes can be added in any number of `run` calls and the state can be saved and resumed.
+    Episodes are generated `batch_size` at a time in lockstep over the compiled transition table.
+    Every episode in flight keeps three floats per state, so fewer episodes run at a time when they
+    would need more than `max_memory` bytes. With `first_visit` only the first visit of a state in
+    an episode counts, otherwise every visit.
+    """
+
+    def __init__(self, env, first_visit=True):
+        self.env = env
+        self.first_visit = first_visit
+        self.transitions = compile_transitions(env)
+        self.sampler = TransitionSampler(env)
+        self.counts = np.zeros(env.nS, dtype=np.int64)
+        self.sums = np.zeros(env.nS)
+        self.sum_squares = np.zeros(env.nS)
+        self.num_episodes = 0
+
+    @property
+    def V(self):
+        "Mean return of every state, 0 for states without returns"
+        return np.divide(self.sums, self.counts, out=np.zeros(len(self.sums)), where=self.counts > 0)
+
+    def variance(self):
+        "Sample variance of the returns of every state, 0 for states with less than two returns"
+        n = self.counts
+        variance = np.divide(self.sum_squares - self.sums * self.V, n - 1, out=np.zeros(len(n)), where=n > 1)
+        return np.maximum(variance, 0)
+
+    def confidence_interval(self, z=1.96):
+        "Normal approximation (lower, upper) bounds of V, z=1.96 for 95%"
+        half_width = z * np.sqrt(np.divide(self.variance(), self.counts, out=np.zeros(len(self.counts)),
+                                           where=self.counts > 0))
+        return self.V - half_width, self.V + half_width
+
+    def values_sorted(self):
+        "[(state, value)] sorted by state, like `mc_policy_evaluation_random_policy`"
+        return list(enumerate(self.V.tolist()))
+
+    def run(self, num_episodes, batch_size=1024, seed=None, max_memory=2 ** 28):
+        "Add `num_episodes` episodes of the random policy to the statistics"
+        if num_episodes <= 0:
+            return
+        T = self.transitions
+        nS, nA = self.env.nS, self.env.nA
+        rng = np.random.default_rng(seed)
+        # per-state records would grow with the episode length, which exceeds nS on large maps,
+        # so the lanes stay dense and their number is bounded instead
+        lanes = max(min(batch_size, num_episodes, max_memory // (3 * 8 * nS)), 1)
+        # every visit return is the episode return minus the reward collected before the visit,
+        # so a lane only sums the visits, the rewards collected before them and their squares
+        visits = np.zeros((lanes, nS))
+        before = np.zeros((lanes, nS))
+        before_squares = np.zeros((lanes, nS))
+        collected = np.zeros(lanes)
+        state = rng.integers(nS, size=lanes)  # draw a random state to start
+        started = lanes
+        active = np.arange(lanes)
+        while len(active):
+            s = state[active]
+            ended = T.terminal[s]
+            if ended.any():
+                self._add_returns(active[ended], visits, before, before_squares, collected)
+                restart = active[ended][:max(num_episodes - started, 0)]
+                state[restart] = rng.integers(nS, size=len(restart))
+                started += len(restart)
+                active = np.concatenate([active[~ended], restart])
+                continue
+            record = visits[active, s] == 0 if self.first_visit else np.ones(len(active), dtype=bool)
+            lane, s_rec = active[record], s[record]
+            visits[lane, s_rec] += 1
+            before[lane, s_rec] += collected[lane]
+            before_squares[lane, s_rec] += collected[lane] ** 2
+            a = rng.integers(nA, size=len(active))  # random policy such that draw an action randomly
+            next_s, reward, _ = self.sampler.sample(s, a, rng)
+            collected[active] += reward
+            state[active] = next_s
+        self.num_episodes += num_episodes
+
+    def _add_returns(self, lanes, visits, before, before_squares, collected):
+        "Fold the finished episodes of `lanes` into the statistics and clear the lanes"
+        G = collected[lanes, None]
+        self.counts += visits[lanes].sum(axis=0).astype(np.int64)
+        self.sums += (visits[lanes] * G - before[lanes]).sum(axis=0)
+        self.sum_squares += (visits[lanes] * G ** 2 - 2 * G * before[lanes] + before_squares[lanes]).sum(axis=0)
+        visits[lanes] = 0
+        before[lanes] = 0
+        before_squares[lanes] = 0
+        collected[lanes] = 0
+
+    def save(self, path):
+        np.savez(path, counts=self.counts, sums=self.sums, sum_squares=self.sum_squares,
+                 num_episodes=self.num_episodes, first_visit=self.first_visit)
+
+    @classmethod
+    def load(cls, env, path):
+        "Resume an evaluator saved with `save`"
+        with np.load(path) as state:
+            evaluator = cls(env, first_visit=bool(state["first_visit"]))
+            evaluator.counts = state["counts"]
+            evaluator.sums = state["sums"]
+            evaluator.sum_squares = state["sum_squares"]
+            evaluator.num_episodes = int(state["num_episodes"])
+        return evaluator
+
+
 if __name__ == '__main__':
     env = GridworldEnv((9, 9))
     print(env.P)
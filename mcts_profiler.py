@@ -0,0 +1,169 @@
+"""
+Optional instrumentation of the MCTS hot path.
+
+`MCTSProfiler(mcts)` replaces the phase methods of one searcher instance (select, expand,
+simulate, simulate_batch, rollout, backup and run_batch) with timed wrappers that also count
+what happened. `detach()` deletes the wrappers again, so an unprofiled searcher runs the plain
+class methods and pays nothing. Works with `MCTS`, `ArrayMCTS` and `TranspositionMCTS`.
+
+    with MCTSProfiler(mcts, snapshot_every=100) as profiler:
+        for _ in range(1000):
+            mcts.run(root, num_rollout=1)
+    print(profiler.summary())
+"""
+import json
+import time
+
+from monte_carlo_tree_search import random_playout_evaluator
+
+PHASES = ["select", "expand", "simulate", "backup"]
+
+
+def level_depth(node):
+    "Depth of a binary tree node, None for nodes without a `level`"
+    return getattr(node, "level", None)
+
+
+class MCTSProfiler:
+    """Per-phase timers and counters of a searcher, plus snapshots of them as records.
+
+    Rollout depth is the difference of `depth(node)` between the terminal node reached and the
+    node the rollout started from, rollouts of nodes without a depth are counted but not measured.
+    Every `snapshot_every` iterations (backups) `snapshot()` appends a record to `snapshots`.
+    """
+
+    def __init__(self, mcts, snapshot_every=None, depth=level_depth):
+        self.mcts = mcts
+        self.snapshot_every = snapshot_every
+        self.depth = depth
+        self.reset()
+        self.attach()
+
+    def reset(self):
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.iterations = 0
+        self.nodes_expanded = 0
+        self.rollouts = 0
+        self.measured_rollouts = 0
+        self.total_rollout_depth = 0
+        self.max_tree_depth = 0
+        self.snapshots = []
+        self.start = time.perf_counter()
+
+    def attach(self):
+        "Install the wrappers on the searcher instance"
+        mcts = self.mcts
+        select, expand, simulate = mcts.select, mcts.expand, mcts.simulate
+        simulate_batch, rollout, backup = mcts.simulate_batch, mcts.rollout, mcts.backup
+        run_batch = mcts.run_batch
+        clock = time.perf_counter
+        times = self.times
+        # simulate_batch may call the wrapped simulate once per rollout, only the outermost call is timed
+        simulating = [False]
+
+        def timed_select(node):
+            start = clock()
+            path = select(node)
+            times["select"] += clock() - start
+            self.max_tree_depth = max(self.max_tree_depth, len(path) - 1)
+            return path
+
+        def timed_expand(node):
+            start = clock()
+            if not mcts.is_expanded(node):
+                self.nodes_expanded += 1
+            expand(node)
+            times["expand"] += clock() - start
+
+        def timed(phase_call):
+            def call(*args):
+                if simulating[0]:
+                    return phase_call(*args)
+                simulating[0] = True
+                start = clock()
+                try:
+                    return phase_call(*args)
+                finally:
+                    times["simulate"] += clock() - start
+                    simulating[0] = False
+            return call
+
+        def counted_simulate_batch(node, num_rollout):
+            if getattr(node, "sample_terminal_rewards", None) is not None:
+                # the rewards are drawn without walking, so there is no terminal node to measure
+                self.rollouts += num_rollout
+            return simulate_batch(node, num_rollout)
+
+        timed_simulate, timed_simulate_batch = timed(simulate), timed(counted_simulate_batch)
+
+        def counted_rollout(node):
+            # timed as part of simulate, which calls it
+            terminal = rollout(node)
+            self.rollouts += 1
+            begin, end = self.depth(node), self.depth(terminal)
+            if begin is not None and end is not None:
+                self.measured_rollouts += 1
+                self.total_rollout_depth += end - begin
+            return terminal
+
+        def timed_backup(path, reward):
+            start = clock()
+            backup(path, reward)
+            times["backup"] += clock() - start
+            self.iterations += 1
+            if self.snapshot_every and self.iterations % self.snapshot_every == 0:
+                self.snapshot()
+
+        def timed_run_batch(node, num_rollout, batch_size, evaluator=random_playout_evaluator, virtual_loss=0.0):
+            # the leaves of a batch are simulated by the evaluator, not by simulate
+            def timed_evaluator(leaves, num_rollout):
+                start = clock()
+                rewards = evaluator(leaves, num_rollout)
+                times["simulate"] += clock() - start
+                self.rollouts += len(leaves) * num_rollout
+                return rewards
+
+            run_batch(node, num_rollout, batch_size, evaluator=timed_evaluator, virtual_loss=virtual_loss)
+
+        mcts.select, mcts.expand, mcts.simulate = timed_select, timed_expand, timed_simulate
+        mcts.simulate_batch, mcts.rollout, mcts.backup = timed_simulate_batch, counted_rollout, timed_backup
+        mcts.run_batch = timed_run_batch
+
+    def detach(self):
+        "Remove the wrappers, the searcher runs its class methods again"
+        for name in ["select", "expand", "simulate", "simulate_batch", "rollout", "backup", "run_batch"]:
+            self.mcts.__dict__.pop(name, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.detach()
+
+    def summary(self):
+        "Current timers and counters as a flat dict"
+        total = sum(self.times.values())
+        record = {"iterations": self.iterations, "elapsed": time.perf_counter() - self.start}
+        for phase in PHASES:
+            record[phase + "_time"] = self.times[phase]
+            record[phase + "_share"] = self.times[phase] / total if total else 0.0
+        record.update({
+            "nodes_expanded": self.nodes_expanded,
+            "rollouts": self.rollouts,
+            "mean_rollout_depth": (self.total_rollout_depth / self.measured_rollouts
+                                   if self.measured_rollouts else None),
+            "max_tree_depth": self.max_tree_depth,
+            "tree_size": self.mcts.tree_size(),
+        })
+        return record
+
+    def snapshot(self):
+        record = self.summary()
+        self.snapshots.append(record)
+        return record
+
+    def write_snapshots(self, path):
+        "Write the snapshots as JSON lines, one record per line"
+        with open(path, "w") as f:
+            for record in self.snapshots:
+                f.write(json.dumps(record) + "\n")
@@ -2,8 +2,59 @@
 BenjaminWang Dec. 2020.
 Adapted from: https://gist.github.com/qpwo/c538c6f73727e254fdc7fab81024f6e1
 """
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from itertools import islice
+import heapq
 import math
+import time
+
+import numpy as np
+
+
+def random_playout_evaluator(leaves, num_rollout):
+    """Default batch evaluator: total reward of `num_rollout` random playouts from each leaf.
+
+    Leaves offering `sample_terminal_rewards` draw all their rollouts at once, the other playouts
+    advance together one level per step. The result is an array aligned with `leaves`.
+    """
+    nodes = [leaf for leaf in leaves for _ in range(num_rollout)]
+    rewards = np.zeros(len(nodes))
+    active = []
+    for j, leaf in enumerate(leaves):
+        sample = getattr(leaf, "sample_terminal_rewards", None)
+        if sample is not None:
+            rewards[j * num_rollout:(j + 1) * num_rollout] = sample(num_rollout)
+        else:
+            active.extend(range(j * num_rollout, (j + 1) * num_rollout))
+    while active:
+        still_active = []
+        for i in active:
+            if nodes[i].is_terminal():
+                rewards[i] = nodes[i].reward()
+            else:
+                nodes[i] = nodes[i].find_random_child()
+                still_active.append(i)
+        active = still_active
+    return rewards.reshape(len(leaves), num_rollout).sum(axis=1)
+
+
+# below this many children scoring in Python is faster than building NumPy arrays
+VECTORIZE_MIN_CHILDREN = 64
+
+
+def _uct_index(q, n, log_n, exploration_weight):
+    "Index of the highest upper confidence bound for trees, the first of equal scores like max() does"
+    if len(q) < VECTORIZE_MIN_CHILDREN:
+        if isinstance(q, np.ndarray):
+            q, n = q.tolist(), n.tolist()
+        scores = [qi / ni + exploration_weight * math.sqrt(log_n / ni) for qi, ni in zip(q, n)]
+        return scores.index(max(scores))
+    q, n = np.asarray(q, dtype=float), np.asarray(n, dtype=float)
+    return int(np.argmax(q / n + exploration_weight * np.sqrt(log_n / n)))
+
+
+# what an anytime search used: `stopped_by` is "iterations", "time" or "nodes"
+SearchStats = namedtuple("SearchStats", ["iterations", "nodes", "elapsed", "stopped_by"])
 
 
 class MCTS:
@@ -13,6 +64,8 @@ class MCTS:
         self.Q = defaultdict(float)  # total reward of each node
         self.N = defaultdict(float)  # total visit count for each node
         self.children = dict()  # children of each node: key is explored node, value is set of children
+        # fully expanded nodes: key is node, value is tuple of its children in the iteration order of the set
+        self.fully_expanded = dict()
         self.exploration_weight = exploration_weight
 
     def choose(self, node):
@@ -35,11 +88,60 @@ class MCTS:
         path = self.select(node)
         leaf = path[-1]
         self.expand(leaf)
-        reward = 0
-        for i in range(num_rollout):
-            reward += self.simulate(leaf)
+        if num_rollout == 1:
+            reward = self.simulate(leaf)
+        else:
+            reward = self.simulate_batch(leaf, num_rollout).sum()
         self.backup(path, reward)
 
+    def search(self, node, num_rollout=1, max_iter=None, max_time=None, max_nodes=None):
+        """Run iterations from node until the first of the budgets is used up.
+
+        `max_iter` bounds the iterations, `max_time` the wall-clock seconds and `max_nodes` the
+        `tree_size()`. Afterwards `choose(node)` returns the best move found so far.
+        """
+        if max_iter is None and max_time is None and max_nodes is None:
+            raise ValueError("search needs at least one of max_iter, max_time and max_nodes")
+        start = time.perf_counter()
+        iterations = 0
+        while True:
+            if max_iter is not None and iterations >= max_iter:
+                stopped_by = "iterations"
+                break
+            if max_time is not None and time.perf_counter() - start >= max_time:
+                stopped_by = "time"
+                break
+            if max_nodes is not None and self.tree_size() >= max_nodes:
+                stopped_by = "nodes"
+                break
+            self.run(node, num_rollout=num_rollout)
+            iterations += 1
+        return SearchStats(iterations, self.tree_size(), time.perf_counter() - start, stopped_by)
+
+    def tree_size(self):
+        "Number of expanded nodes held by the searcher"
+        return len(self.children)
+
+    def is_expanded(self, node):
+        return node in self.children
+
+    def run_batch(self, node, num_rollout, batch_size, evaluator=random_playout_evaluator, virtual_loss=0.0):
+        """Run `batch_size` iterations whose leaves are evaluated together.
+
+        Leaves are selected one after another with virtual loss on the pending paths so they differ,
+        `evaluator(leaves, num_rollout)` returns the total reward of each leaf, then all paths are backed up.
+        """
+        paths = []
+        for _ in range(batch_size):
+            path = self.select(node)
+            self.expand(path[-1])
+            self.add_virtual_loss(path, virtual_loss)
+            paths.append(path)
+        rewards = evaluator([path[-1] for path in paths], num_rollout)
+        for path, reward in zip(paths, rewards):
+            self.revert_virtual_loss(path, virtual_loss)
+            self.backup(path, reward)
+
     def select(self, node):
         "Find an unexplored descendent of `node`"
         path = []
@@ -48,11 +150,14 @@ class MCTS:
             if node not in self.children or not self.children[node]:
                 # node is either unexplored or terminal
                 return path
-            unexplored = self.children[node] - self.children.keys()
-            if unexplored:
-                n = unexplored.pop()
-                path.append(n)
-                return path
+            if node not in self.fully_expanded:
+                unexplored = self.children[node] - self.children.keys()
+                if unexplored:
+                    n = unexplored.pop()
+                    path.append(n)
+                    return path
+                # children never become unexplored again, so we only need to check once
+                self.fully_expanded[node] = tuple(self.children[node])
             node = self._uct_select(node)  # descend a layer deeper
 
     def expand(self, node):
@@ -63,9 +168,23 @@ class MCTS:
 
     def simulate(self, node):
         "Run a random simulation from node as starting point"
+        return self.rollout(node).reward()
+
+    def simulate_batch(self, node, num_rollout):
+        "Rewards of `num_rollout` random simulations from node, as an array"
+        sample = getattr(node, "sample_terminal_rewards", None)
+        if sample is not None:
+            return sample(num_rollout)
+        return np.array([self.simulate(node) for _ in range(num_rollout)], dtype=float)
+
+    def rollout(self, node):
+        "Random terminal descendant of node, jumping straight to it if node can `sample_terminal_descendant`"
+        sample = getattr(node, "sample_terminal_descendant", None)
+        if sample is not None:
+            return sample()
         while True:
             if node.is_terminal():
-                return node.reward()
+                return node
             node = node.find_random_child()
 
     def backup(self, path, reward):
@@ -74,21 +193,560 @@ class MCTS:
             self.N[node] += 1
             self.Q[node] += reward
 
+    def advance_root(self, root):
+        """Keep the statistics of the subtree below `root` (usually the chosen move) and free the rest.
+
+        Returns the number of nodes kept and freed.
+        """
+        keep = self._subtree(root)
+        known = self.N.keys() | self.children.keys()
+        kept = known & keep
+        self.Q = defaultdict(float, {n: q for n, q in self.Q.items() if n in keep})
+        self.N = defaultdict(float, {n: v for n, v in self.N.items() if n in keep})
+        self.children = type(self.children)((n, c) for n, c in self.children.items() if n in keep)
+        self.fully_expanded = {n: c for n, c in self.fully_expanded.items() if n in keep}
+        return len(kept), len(known) - len(kept)
+
+    def _subtree(self, root):
+        "Set of statistics keys reachable from root through the `children` dict"
+        keep = {root}
+        frontier = [root]
+        while frontier:
+            for child in self.children.get(frontier.pop(), ()):
+                if child not in keep:
+                    keep.add(child)
+                    frontier.append(child)
+        return keep
+
+    def add_virtual_loss(self, path, virtual_loss=0.0):
+        "Count a pending visit with reward `virtual_loss` on `path`, so concurrent selections avoid it"
+        for node in path:
+            self.N[node] += 1
+            self.Q[node] += virtual_loss
+
+    def revert_virtual_loss(self, path, virtual_loss=0.0):
+        "Undo `add_virtual_loss` once the real reward of the pending visit is known"
+        for node in path:
+            self.N[node] -= 1
+            self.Q[node] -= virtual_loss
+
     def _uct_select(self, node):
         "Select a child of node, balancing exploration & exploitation"
 
         # All children of node should already be expanded:
         # a node is fully expanded if and only if all children are explored
-        is_all_children_expanded = all(n in self.children for n in self.children[node])
-        if not is_all_children_expanded:
+        children = self.fully_expanded.get(node)
+        if children is None:
+            raise ValueError("Can only select fom fully expanded node")
+
+        q = [self.Q[n] for n in children]
+        n = [self.N[n] for n in children]
+        return children[_uct_index(q, n, math.log(self.N[node]), self.exploration_weight)]
+
+
+class SolverMCTS(MCTS):
+    """Monte Carlo tree searcher proving exact values (MCTS-Solver) for deterministic rewards.
+
+    A terminal node is proven with its reward once expanded, a node whose children are all
+    proven is proven with the max of their values. Proven nodes are not simulated anymore and
+    selection skips proven children, so iterations go to the parts of the tree still unknown.
+    `choose` returns the best child of a proven node.
+    """
+
+    def __init__(self, exploration_weight=1.0):
+        super().__init__(exploration_weight=exploration_weight)
+        self.proven = dict()  # node -> exact max reward below it
+
+    def is_proven(self, node):
+        return node in self.proven
+
+    def choose(self, node):
+        "Choose the best successor of node, the proven optimum if node is proven"
+        if node.is_terminal():
+            raise RuntimeError(f"choose called on terminal node {node}")
+        if node in self.proven:
+            return max(self.children[node], key=self.proven.__getitem__)
+        return super().choose(node)
+
+    def select(self, node):
+        "Find an unexplored descendent of `node`, stopping early at a proven node"
+        path = []
+        while True:
+            path.append(node)
+            if node in self.proven or node not in self.children or not self.children[node]:
+                # node is proven, unexplored or terminal
+                return path
+            if node not in self.fully_expanded:
+                unexplored = self.children[node] - self.children.keys()
+                if unexplored:
+                    path.append(unexplored.pop())
+                    return path
+                self.fully_expanded[node] = tuple(self.children[node])
+            child = self._uct_select(node)
+            if child is None:
+                # the children were proven by leaves of a batch that is not backed up yet
+                self.proven[node] = max(self.proven[c] for c in self.children[node])
+                return path
+            node = child  # descend a layer deeper
+
+    def expand(self, node):
+        "Update the `children` dict with the children of `node`, proving terminal nodes"
+        if node in self.children:
+            return  # already expanded
+        self.children[node] = node.find_children()
+        if node.is_terminal():
+            self.proven[node] = node.reward()
+
+    def simulate(self, node):
+        if node in self.proven:
+            return self.proven[node]
+        return super().simulate(node)
+
+    def simulate_batch(self, node, num_rollout):
+        if node in self.proven:
+            return np.full(num_rollout, self.proven[node])
+        return super().simulate_batch(node, num_rollout)
+
+    def backup(self, path, reward):
+        "Send the reward back up to the ancestors of the leaf and prove the ancestors whose children are proven"
+        super().backup(path, reward)
+        for node in reversed(path[:-1]):
+            if node in self.proven:
+                continue
+            values = [self.proven.get(c) for c in self.children[node]]
+            if None in values:
+                break
+            self.proven[node] = max(values)
+
+    def advance_root(self, root):
+        kept, freed = super().advance_root(root)
+        self.proven = {n: v for n, v in self.proven.items() if n in self.children}
+        return kept, freed
+
+    def _uct_select(self, node):
+        "Select an unproven child of node, balancing exploration & exploitation, None if all are proven"
+        children = self.fully_expanded.get(node)
+        if children is None:
+            raise ValueError("Can only select fom fully expanded node")
+
+        children = [c for c in children if c not in self.proven]
+        if not children:
+            return None
+        q = [self.Q[n] for n in children]
+        n = [self.N[n] for n in children]
+        return children[_uct_index(q, n, math.log(self.N[node]), self.exploration_weight)]
+
+
+def iter_children(node):
+    "Children of node one at a time, from `node.iter_children()` if node has it, else from `find_children()`"
+    generate = getattr(node, "iter_children", None)
+    if generate is not None:
+        return generate()
+    return iter(node.find_children())
+
+
+class ProgressiveWideningMCTS(MCTS):
+    """Monte Carlo tree searcher for nodes with many children, using progressive widening.
+
+    Children are drawn lazily from `children_fn(node)`, an iterator (or an endless sampler of
+    distinct children), and a node visited N times considers at most
+    max(1, widening_constant * N ** widening_exponent) of them. `children[node]` is the list
+    drawn so far; as every drawn child is expanded by the iteration that drew it, the next
+    unexplored child is always the next one of the iterator.
+    """
+
+    def __init__(self, exploration_weight=1.0, widening_constant=1.0, widening_exponent=0.5,
+                 children_fn=iter_children):
+        super().__init__(exploration_weight=exploration_weight)
+        self.widening_constant = widening_constant
+        self.widening_exponent = widening_exponent
+        self.children_fn = children_fn
+        self.generators = dict()  # node -> iterator of the children not drawn yet, dropped once exhausted
+
+    def width(self, node):
+        "Number of children node may consider at its current visit count"
+        return max(1, self.widening_constant * self.N[node] ** self.widening_exponent)
+
+    def select(self, node):
+        "Find an unexplored descendent of `node`, drawing a new child when the width allows it"
+        path = []
+        while True:
+            path.append(node)
+            if node not in self.children:
+                return path  # unexplored
+            children = self.children[node]
+            if node in self.generators and len(children) < self.width(node):
+                child = next(self.generators[node], None)
+                if child is not None:
+                    children.append(child)
+                    path.append(child)
+                    return path
+                del self.generators[node]
+            if not children:
+                return path  # terminal
+            node = self._uct_select(node)  # descend a layer deeper
+
+    def expand(self, node):
+        "Start drawing the children of `node`"
+        if node in self.children:
+            return  # already expanded
+        self.children[node] = []
+        if not node.is_terminal():
+            self.generators[node] = self.children_fn(node)
+
+    def advance_root(self, root):
+        kept, freed = super().advance_root(root)
+        self.generators = {n: g for n, g in self.generators.items() if n in self.children}
+        return kept, freed
+
+    def _uct_select(self, node):
+        "Select one of the children drawn so far, balancing exploration & exploitation"
+        children = self.children[node]
+        n = [self.N[n] for n in children]
+        if 0 in n:
+            return children[n.index(0)]  # a pending child of a batch, not backed up yet
+        q = [self.Q[n] for n in children]
+        return children[_uct_index(q, n, math.log(self.N[node]), self.exploration_weight)]
+
+
+def _grow(array, size, fill=0):
+    "Return a copy of `array` enlarged to at least `size` entries, doubling the capacity"
+    capacity = max(len(array), 1)
+    while capacity < size:
+        capacity *= 2
+    grown = np.full(capacity, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class ArrayMCTS(MCTS):
+    """Monte Carlo tree searcher storing node statistics in contiguous NumPy arrays.
+
+    Every node seen by the search gets an integer id. Visit counts, total rewards and
+    the range of child ids of a node are stored in arrays indexed by that id, which
+    grow as needed. The public interface (`choose`, `run`) is the same as `MCTS`,
+    rollouts are inherited from it.
+    """
+
+    def __init__(self, exploration_weight=1.0, capacity=1024):
+        self.exploration_weight = exploration_weight
+        self.node_ids = dict()  # node -> integer id
+        self.nodes = []  # integer id -> node
+        self.Q = np.zeros(capacity)  # total reward of each node id
+        self.N = np.zeros(capacity)  # total visit count of each node id
+        # children of node i are child_ids[child_start[i]:child_start[i] + child_count[i]],
+        # child_start is -1 as long as node i is not expanded
+        self.child_start = np.full(capacity, -1, dtype=np.int64)
+        self.child_count = np.zeros(capacity, dtype=np.int64)
+        self.fully_expanded = np.zeros(capacity, dtype=bool)  # set once all children of a node are expanded
+        self.child_ids = np.zeros(capacity, dtype=np.int64)
+        self.num_child_ids = 0
+        self.num_expanded = 0
+
+    def __len__(self):
+        "Number of nodes known to the searcher"
+        return len(self.nodes)
+
+    def tree_size(self):
+        "Number of expanded nodes, as for `MCTS` children seen but not expanded are not counted"
+        return self.num_expanded
+
+    def is_expanded(self, node):
+        i = self.node_ids.get(node)
+        return i is not None and self.child_start[i] >= 0
+
+    def node_id(self, node):
+        "Return the integer id of node, allocating a new one if node is unseen"
+        i = self.node_ids.get(node)
+        if i is None:
+            i = len(self.nodes)
+            if i >= len(self.N):
+                self.Q = _grow(self.Q, i + 1)
+                self.N = _grow(self.N, i + 1)
+                self.child_start = _grow(self.child_start, i + 1, fill=-1)
+                self.child_count = _grow(self.child_count, i + 1)
+                self.fully_expanded = _grow(self.fully_expanded, i + 1)
+            self.node_ids[node] = i
+            self.nodes.append(node)
+        return i
+
+    def children_of(self, i):
+        "Array of child ids of the expanded node id i"
+        start = self.child_start[i]
+        return self.child_ids[start:start + self.child_count[i]]
+
+    def choose(self, node):
+        "Choose the best successor of node. (Choose a move in the game)"
+        if node.is_terminal():
+            raise RuntimeError(f"choose called on terminal node {node}")
+
+        i = self.node_ids.get(node)
+        if i is None or self.child_start[i] < 0:
+            return node.find_random_child()
+
+        ids = self.children_of(i)
+        n = self.N[ids]
+        # avoid unseen moves, otherwise average reward
+        scores = np.full(len(ids), float("-inf"))
+        np.divide(self.Q[ids], n, out=scores, where=n > 0)
+        return self.nodes[ids[np.argmax(scores)]]
+
+    def run(self, node, num_rollout):
+        "Run on iteration of select -> expand -> simulation(rollout) -> backup"
+        path = self.select(node)
+        leaf = self.nodes[path[-1]]
+        self.expand(leaf)
+        if num_rollout == 1:
+            reward = self.simulate(leaf)
+        else:
+            reward = self.simulate_batch(leaf, num_rollout).sum()
+        self.backup(path, reward)
+
+    def run_batch(self, node, num_rollout, batch_size, evaluator=random_playout_evaluator, virtual_loss=0.0):
+        "Run `batch_size` iterations whose leaves are evaluated together, see `MCTS.run_batch`"
+        paths = []
+        for _ in range(batch_size):
+            path = self.select(node)
+            self.expand(self.nodes[path[-1]])
+            self.add_virtual_loss(path, virtual_loss)
+            paths.append(path)
+        rewards = evaluator([self.nodes[path[-1]] for path in paths], num_rollout)
+        for path, reward in zip(paths, rewards):
+            self.revert_virtual_loss(path, virtual_loss)
+            self.backup(path, reward)
+
+    def select(self, node):
+        "Find an unexplored descendent of `node`, returns the path as a list of node ids"
+        path = []
+        i = self.node_id(node)
+        while True:
+            path.append(i)
+            if self.child_start[i] < 0 or self.child_count[i] == 0:
+                # node is either unexplored or terminal
+                return path
+            if not self.fully_expanded[i]:
+                ids = self.children_of(i)
+                unexplored = ids[self.child_start[ids] < 0]
+                if len(unexplored):
+                    path.append(int(unexplored[0]))
+                    return path
+                self.fully_expanded[i] = True
+            i = self._uct_select(i)  # descend a layer deeper
+
+    def expand(self, node):
+        "Allocate ids for the children of `node` and store them contiguously"
+        i = self.node_id(node)
+        if self.child_start[i] >= 0:
+            return  # already expanded
+        ids = [self.node_id(n) for n in node.find_children()]
+        start = self.num_child_ids
+        if start + len(ids) > len(self.child_ids):
+            self.child_ids = _grow(self.child_ids, start + len(ids))
+        self.child_ids[start:start + len(ids)] = ids
+        self.num_child_ids += len(ids)
+        self.child_start[i] = start
+        self.child_count[i] = len(ids)
+        self.num_expanded += 1
+
+    def backup(self, path, reward):
+        "Send the reward back up to the ancestors of the leaf"
+        self.N[path] += 1
+        self.Q[path] += reward
+
+    def advance_root(self, root):
+        """Keep the statistics of the subtree below `root` and free the rest, compacting the arrays.
+
+        Node ids are renumbered. Returns the number of nodes kept and freed.
+        """
+        total = len(self.nodes)
+        root_id = self.node_ids.get(root)
+        keep = np.zeros(total, dtype=bool)
+        if root_id is not None:
+            keep[root_id] = True
+            frontier = np.array([root_id])
+            while len(frontier):
+                expanded = frontier[self.child_start[frontier] >= 0]
+                if not len(expanded):
+                    break
+                children = np.concatenate([self.children_of(i) for i in expanded])
+                frontier = np.unique(children[~keep[children]])
+                keep[frontier] = True
+
+        # the arrays shrink to the kept nodes and grow again from there
+        old_ids = np.flatnonzero(keep)
+        new_ids = np.cumsum(keep) - 1
+        # children of the kept nodes are kept as well, store their new ids contiguously again
+        child_ids = [new_ids[self.children_of(i)] for i in old_ids if self.child_start[i] >= 0]
+        counts = self.child_count[old_ids]
+        self.child_start = np.where(self.child_start[old_ids] >= 0, np.cumsum(counts) - counts, -1)
+        self.child_count = counts
+        self.child_ids = np.concatenate(child_ids) if child_ids else np.zeros(0, dtype=np.int64)
+        self.num_child_ids = len(self.child_ids)
+        self.num_expanded = len(child_ids)
+        self.Q = self.Q[old_ids]
+        self.N = self.N[old_ids]
+        self.fully_expanded = self.fully_expanded[old_ids]
+        self.nodes = [self.nodes[i] for i in old_ids]
+        self.node_ids = {node: i for i, node in enumerate(self.nodes)}
+        return len(old_ids), total - len(old_ids)
+
+    def add_virtual_loss(self, path, virtual_loss=0.0):
+        "Count a pending visit with reward `virtual_loss` on `path`, so concurrent selections avoid it"
+        self.N[path] += 1
+        self.Q[path] += virtual_loss
+
+    def revert_virtual_loss(self, path, virtual_loss=0.0):
+        "Undo `add_virtual_loss` once the real reward of the pending visit is known"
+        self.N[path] -= 1
+        self.Q[path] -= virtual_loss
+
+    def _uct_select(self, i):
+        "Select a child id of node id i, balancing exploration & exploitation"
+        if not self.fully_expanded[i]:
             raise ValueError("Can only select fom fully expanded node")
 
-        log_N_parent = math.log(self.N[node])
+        ids = self.children_of(i)
+        return int(ids[_uct_index(self.Q[ids], self.N[ids], math.log(self.N[i]), self.exploration_weight)])
+
+
+class TranspositionMCTS(MCTS):
+    """Monte Carlo tree searcher sharing statistics between nodes with the same state key.
+
+    Q, N and children are keyed by `key(node)`, so a state reachable by different paths is
+    searched once. The keys must not allow a path to revisit a state (a DAG, e.g. by including
+    the number of steps left), otherwise selection could loop forever. With `max_size` the table
+    keeps at most that many expanded states and evicts in chunks either the least recently used
+    (eviction="lru") or the least visited (eviction="visits") states.
+
+    Nodes whose `is_chance()` returns True are chance nodes of a stochastic environment, e.g. an
+    action whose outcome is not known yet. Selection passes them by drawing a fresh child with
+    `find_random_child()` on every descent instead of choosing one by UCT.
+    """
+
+    def __init__(self, key, exploration_weight=1.0, max_size=None, eviction="lru"):
+        if eviction not in ("lru", "visits"):
+            raise ValueError("eviction must be 'lru' or 'visits', got {}".format(eviction))
+        super().__init__(exploration_weight=exploration_weight)
+        self.key = key
+        self.max_size = max_size
+        self.eviction = eviction
+        self.children = OrderedDict()  # least recently used first
+        self.pending = Counter()  # key -> pending visits of paths carrying virtual loss, never evicted
+        self.num_evicted = 0
+
+    def choose(self, node):
+        "Choose the best successor of node. (Choose a move in the game)"
+        if node.is_terminal():
+            raise RuntimeError(f"choose called on terminal node {node}")
 
-        def uct(n):
-            "Upper confidence bound for trees"
-            return self.Q[n] / self.N[n] + self.exploration_weight * math.sqrt(
-                log_N_parent / self.N[n]
-            )
+        k = self.key(node)
+        if k not in self.children:
+            return node.find_random_child()
+
+        def score(n):
+            n = self.key(n)
+            if self.N.get(n, 0) == 0:
+                return float("-inf")  # avoid unseen moves
+            return self.Q[n] / self.N[n]  # average reward
+
+        return max(self.children[k], key=score)
+
+    def select(self, node):
+        "Find an unexplored descendent of `node`"
+        path = []
+        while True:
+            path.append(node)
+            k = self.key(node)
+            if k not in self.children or not self.children[k]:
+                # node is either unexplored or terminal
+                return path
+            is_chance = getattr(node, "is_chance", None)
+            if is_chance is not None and is_chance():
+                node = node.find_random_child()  # the environment decides, not the searcher
+                continue
+            if k not in self.fully_expanded:
+                for n in self.children[k]:
+                    if self.key(n) not in self.children:
+                        path.append(n)
+                        return path
+                self.fully_expanded[k] = tuple(self.children[k])
+            node = self._uct_select(node)  # descend a layer deeper
+
+    def expand(self, node):
+        "Update the `children` dict with the children of `node`"
+        k = self.key(node)
+        if k in self.children:
+            return  # already expanded
+        self.children[k] = node.find_children()
+
+    def is_expanded(self, node):
+        return self.key(node) in self.children
+
+    def backup(self, path, reward):
+        "Send the reward back up to the ancestors of the leaf, shared by all nodes with the same key"
+        keys = [self.key(node) for node in path]
+        for k in reversed(keys):
+            self.N[k] += 1
+            self.Q[k] += reward
+            if k in self.children:
+                self.children.move_to_end(k)
+        if self.max_size is not None and len(self.children) > self.max_size:
+            self._evict(set(keys) | self.pending.keys())
+
+    def _evict(self, protected):
+        "Drop states until the table fits, never the ones on the path just backed up or still pending"
+        # evict a chunk at once, the cached fully expanded flags must be rebuilt after every eviction
+        count = max(len(self.children) - self.max_size, self.max_size // 10)
+        candidates = (k for k in self.children if k not in protected)
+        if self.eviction == "lru":
+            victims = list(islice(candidates, count))
+        else:
+            victims = heapq.nsmallest(count, candidates, key=lambda k: self.N[k])
+        for k in victims:
+            del self.children[k]
+            self.Q.pop(k, None)
+            self.N.pop(k, None)
+        self.fully_expanded.clear()
+        self.num_evicted += len(victims)
+
+    def _subtree(self, root):
+        "Set of state keys reachable from root through the `children` dict"
+        keep = {self.key(root)}
+        frontier = [root]
+        while frontier:
+            for child in self.children.get(self.key(frontier.pop()), ()):
+                k = self.key(child)
+                if k not in keep:
+                    keep.add(k)
+                    frontier.append(child)
+        return keep
+
+    def add_virtual_loss(self, path, virtual_loss=0.0):
+        "Count a pending visit with reward `virtual_loss` on `path`, so concurrent selections avoid it"
+        for node in path:
+            k = self.key(node)
+            self.N[k] += 1
+            self.Q[k] += virtual_loss
+            self.pending[k] += 1
+
+    def revert_virtual_loss(self, path, virtual_loss=0.0):
+        "Undo `add_virtual_loss` once the real reward of the pending visit is known"
+        for node in path:
+            k = self.key(node)
+            self.N[k] -= 1
+            self.Q[k] -= virtual_loss
+            self.pending[k] -= 1
+            if not self.pending[k]:
+                del self.pending[k]
+
+    def _uct_select(self, node):
+        "Select a child of node, balancing exploration & exploitation"
+        k = self.key(node)
+        children = self.fully_expanded.get(k)
+        if children is None:
+            raise ValueError("Can only select fom fully expanded node")
 
-        return max(self.children[node], key=uct)
+        keys = [self.key(n) for n in children]
+        q = [self.Q[n] for n in keys]
+        n = [self.N[n] for n in keys]
+        return children[_uct_index(q, n, math.log(self.N[k]), self.exploration_weight)]
@@ -0,0 +1,195 @@
+"""
+Parallel variants of the Monte Carlo tree searcher.
+
+Root parallelism runs independent `MCTS` instances in a process pool and merges the
+statistics of the root's children before choosing a move. Tree parallelism lets several
+threads share a single tree, using virtual loss so they do not all descend the same path.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import os
+import random
+import threading
+import time
+
+from binary_tree import make_binary_tree
+from checkpoint import TreeCheckpoint, warm_start
+from monte_carlo_tree_search import MCTS
+
+# root of the whole tree and the optional memory-mapped checkpoint inside a worker process,
+# set once by the pool initializer
+_worker_root = None
+_worker_checkpoint = None
+
+
+def _init_worker(root, checkpoint_path=None):
+    global _worker_root, _worker_checkpoint
+    _worker_root = root
+    if checkpoint_path is not None:
+        _worker_checkpoint = TreeCheckpoint(checkpoint_path)
+
+
+def _root_worker(path, num_iter, num_rollout, exploration_weight, seed, key):
+    "Run an independent search below the node reached by following `path` from the worker root"
+    random.seed(seed)
+    node = _worker_root
+    for k in path:
+        node = next(c for c in node.find_children() if key(c) == k)
+    mcts = MCTS(exploration_weight=exploration_weight)
+    prior = {}
+    if _worker_checkpoint is not None:
+        warm_start(mcts, _worker_checkpoint, node, key=key)
+        # the coordinator adds the saved statistics once, workers only report what they added
+        prior = {n: (mcts.Q[n], mcts.N[n]) for n in [node, *mcts.children.get(node, ())]}
+    for _ in range(num_iter):
+        mcts.run(node, num_rollout=num_rollout)
+
+    def added(n):
+        q, v = prior.get(n, (0.0, 0.0))
+        return mcts.Q[n] - q, mcts.N[n] - v
+
+    stats = {key(c): added(c) for c in mcts.children.get(node, ())}
+    return stats, added(node)
+
+
+class RootParallelMCTS(MCTS):
+    """Root parallel searcher, every worker process searches its own tree.
+
+    Nodes are identified across processes by `key`, which must be picklable and unique
+    among the children of a node. The tree below `root` is sent to each worker once.
+    With `checkpoint`, the directory of a tree saved by `checkpoint.save_tree` with the same
+    key, every worker warm-starts its searches from the memory-mapped saved statistics.
+    """
+
+    def __init__(self, root, exploration_weight=1.0, num_workers=None, key=str, checkpoint=None):
+        super().__init__(exploration_weight=exploration_weight)
+        self.key = key
+        self.num_workers = num_workers or os.cpu_count()
+        self.paths = {root: ()}  # node -> keys leading from root to node
+        self.checkpoint = TreeCheckpoint(checkpoint) if checkpoint is not None else None
+        self.warm_started = set()  # nodes whose saved statistics were added already
+        self.pool = ProcessPoolExecutor(self.num_workers, initializer=_init_worker, initargs=(root, checkpoint))
+
+    def run_parallel(self, node, num_iter, num_rollout):
+        "Run `num_iter` iterations in every worker and merge the statistics of node's children"
+        path = self.paths[node]
+        futures = [
+            self.pool.submit(_root_worker, path, num_iter, num_rollout, self.exploration_weight,
+                             random.getrandbits(32), self.key)
+            for _ in range(self.num_workers)
+        ]
+        self.expand(node)
+        if self.checkpoint is not None:
+            # a chosen child was warm-started with its parent, its saved statistics count once
+            for n in [node, *self.children[node]]:
+                if n not in self.warm_started:
+                    warm_start(self, self.checkpoint, n, key=self.key, max_depth=0)
+                    self.warm_started.add(n)
+        children = {self.key(c): c for c in self.children[node]}
+        for future in futures:
+            stats, (q, n) = future.result()
+            self.Q[node] += q
+            self.N[node] += n
+            for k, (q, n) in stats.items():
+                child = children[k]
+                self.Q[child] += q
+                self.N[child] += n
+        for k, child in children.items():
+            self.paths[child] = path + (k,)
+
+    def advance_root(self, root):
+        keep = self._subtree(root)
+        kept, freed = super().advance_root(root)
+        self.paths = {n: p for n, p in self.paths.items() if n in keep}
+        self.warm_started &= keep
+        return kept, freed
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TreeParallelMCTS(MCTS):
+    """Tree parallel searcher, worker threads share one tree.
+
+    Selection, expansion and backup hold a lock; rollouts run outside of it. While a
+    rollout is pending its path carries a virtual visit with reward `virtual_loss`.
+    """
+
+    def __init__(self, exploration_weight=1.0, virtual_loss=0.0):
+        super().__init__(exploration_weight=exploration_weight)
+        self.virtual_loss = virtual_loss
+        self.lock = threading.Lock()
+
+    def run(self, node, num_rollout):
+        "Run on iteration of select -> expand -> simulation(rollout) -> backup"
+        with self.lock:
+            path = self.select(node)
+            leaf = path[-1]
+            self.expand(leaf)
+            self.add_virtual_loss(path, self.virtual_loss)
+        reward = 0
+        for i in range(num_rollout):
+            reward += self.simulate(leaf)
+        with self.lock:
+            self.revert_virtual_loss(path, self.virtual_loss)
+            self.backup(path, reward)
+
+    def run_parallel(self, node, num_iter, num_rollout, num_workers=None):
+        "Run `num_iter` iterations spread over `num_workers` threads"
+        with ThreadPoolExecutor(num_workers or os.cpu_count()) as pool:
+            for future in [pool.submit(self.run, node, num_rollout) for _ in range(num_iter)]:
+                future.result()
+
+
+def benchmark(depth, num_iter, num_rollout, exploration_weight, num_workers, seeds):
+    "Compare decisions per second and found leaf value of the serial and the parallel searchers"
+    for mode in ["serial", "root", "tree"]:
+        decisions, elapsed, regrets = 0, 0.0, []
+        for seed in seeds:
+            random.seed(seed)
+            root, leaf_nodes_dict = make_binary_tree(depth=depth)
+            best = max(leaf_nodes_dict.values())
+            start = time.perf_counter()
+            if mode == "root":
+                mcts = RootParallelMCTS(root, exploration_weight=exploration_weight, num_workers=num_workers)
+            elif mode == "tree":
+                mcts = TreeParallelMCTS(exploration_weight=exploration_weight)
+            else:
+                mcts = MCTS(exploration_weight=exploration_weight)
+            node = root
+            while not node.is_terminal():
+                if mode == "root":
+                    mcts.run_parallel(node, num_iter, num_rollout)
+                elif mode == "tree":
+                    mcts.run_parallel(node, num_iter, num_rollout, num_workers=num_workers)
+                else:
+                    for _ in range(num_iter):
+                        mcts.run(node, num_rollout=num_rollout)
+                node = mcts.choose(node)
+                decisions += 1
+            if mode == "root":
+                mcts.close()
+            elapsed += time.perf_counter() - start
+            regrets.append(best - node.value)
+        print("{:>6}: {:8.1f} decisions/s, mean regret {:.3f}, max regret {:.3f}".format(
+            mode, decisions / elapsed, sum(regrets) / len(regrets), max(regrets)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark serial, root parallel and tree parallel MCTS')
+    parser.add_argument("--num_iter", type=int, default=50,
+                        help="number of MCTS iterations (per worker for root parallelism) before each move")
+    parser.add_argument("--num_rollout", type=int, default=1, help="number of rollout simulations in a MCTS iteration")
+    parser.add_argument("--depth", type=int, default=12, help="number of depth of the binary tree")
+    parser.add_argument("--exploration_weight", type=float, default=51, help="exploration weight, c number in UCT")
+    parser.add_argument("--num_workers", type=int, default=None, help="number of processes/threads, default all cores")
+    parser.add_argument("--num_seeds", type=int, default=5, help="number of random trees to average over")
+    args = parser.parse_args()
+    benchmark(args.depth, args.num_iter, args.num_rollout, args.exploration_weight, args.num_workers,
+              range(args.num_seeds))
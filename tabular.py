@@ -0,0 +1,290 @@
+"""
+Tabular learners running on dense NumPy arrays compiled from a DiscreteEnv's `P`.
+"""
+from collections import defaultdict, namedtuple
+import argparse
+import random
+import time
+
+import numpy as np
+
+# dense (nS, nA) arrays of the outcome of every action, plus a (nS,) array of terminal states
+Transitions = namedtuple("Transitions", ["next_state", "reward", "done", "terminal"])
+
+# (nS, nA, K) arrays of every outcome of every action, plus a (nS,) array of terminal states
+Model = namedtuple("Model", ["prob", "next_state", "reward", "done", "terminal"])
+
+
+def compile_transitions(env):
+    "Compile `env.P[s][a][0]`, the first outcome of every action, into dense next state, reward and done arrays"
+    if isinstance(getattr(env, "transitions", None), Transitions):
+        return env.transitions  # already compiled by the environment
+    next_state = np.zeros((env.nS, env.nA), dtype=np.int64)
+    reward = np.zeros((env.nS, env.nA))
+    done = np.zeros((env.nS, env.nA), dtype=bool)
+    for s in range(env.nS):
+        for a in range(env.nA):
+            _, next_state[s, a], reward[s, a], done[s, a] = env.P[s][a][0]
+    terminal = np.array([env.is_terminal(s) for s in range(env.nS)], dtype=bool)
+    return Transitions(next_state, reward, done, terminal)
+
+
+def compile_model(env):
+    "Compile every outcome of `env.P` into (nS, nA, K) arrays, padded with zero probability outcomes"
+    if isinstance(env, Model):
+        return env
+    if isinstance(getattr(env, "model", None), Model):
+        return env.model  # already compiled by the environment
+    T = getattr(env, "transitions", None)
+    if isinstance(T, Transitions):
+        # deterministic transitions compiled by the environment, a single outcome per action
+        return Model(np.ones(T.reward.shape + (1,)), T.next_state[..., None], T.reward[..., None],
+                     T.done[..., None], T.terminal)
+    K = max(len(env.P[s][a]) for s in range(env.nS) for a in range(env.nA))
+    prob = np.zeros((env.nS, env.nA, K))
+    next_state = np.zeros((env.nS, env.nA, K), dtype=np.int64)
+    reward = np.zeros((env.nS, env.nA, K))
+    done = np.zeros((env.nS, env.nA, K), dtype=bool)
+    for s in range(env.nS):
+        for a in range(env.nA):
+            for k, (p, s_next, r, d) in enumerate(env.P[s][a]):
+                prob[s, a, k], next_state[s, a, k], reward[s, a, k], done[s, a, k] = p, s_next, r, d
+    terminal = np.array([env.is_terminal(s) for s in range(env.nS)], dtype=bool)
+    return Model(prob, next_state, reward, done, terminal)
+
+
+def alias_tables(prob):
+    """Acceptance probabilities and aliases of the alias method for every row of outcome probabilities.
+
+    `prob` is a (..., K) array. In each of K - 1 rounds the least likely unfinished column of
+    every row is filled up to 1 by its most likely one, which becomes its alias; all rows are
+    processed at once.
+    """
+    K = prob.shape[-1]
+    scaled = (prob * K / prob.sum(axis=-1, keepdims=True)).reshape(-1, K)
+    rows = np.arange(len(scaled))
+    accept = np.ones(scaled.shape)
+    alias = np.broadcast_to(np.arange(K), scaled.shape).copy()
+    finished = np.zeros(scaled.shape, dtype=bool)
+    for _ in range(K - 1):
+        small = np.where(finished, np.inf, scaled).argmin(axis=1)
+        finished[rows, small] = True
+        large = np.where(finished, -np.inf, scaled).argmax(axis=1)
+        accept[rows, small] = scaled[rows, small]
+        alias[rows, small] = large
+        scaled[rows, large] -= 1.0 - scaled[rows, small]
+    # the last column left has probability 1 up to rounding
+    return accept.reshape(prob.shape), alias.reshape(prob.shape)
+
+
+class TransitionSampler:
+    """Draws outcomes of `env.P[s][a]` with their probabilities in O(1), using alias tables.
+
+    Every (state, action) with K padded outcomes gets an alias table: pick one of the K columns
+    uniformly, keep it with its acceptance probability or take its alias otherwise. Actions with a
+    single outcome draw no random number at all, so deterministic environments behave exactly as
+    with `P[s][a][0]`. `step` draws one transition with the `random` module for the dict loops,
+    `sample` many at once with a NumPy generator.
+    """
+
+    def __init__(self, env):
+        self.model = model = compile_model(env)
+        self.terminal = model.terminal
+        self.accept, self.alias = alias_tables(model.prob)
+        self.stochastic = (model.prob > 0).sum(axis=2) > 1
+        self.deterministic = not self.stochastic.any()
+        # the outcome of a deterministic action is its most likely one, as the padding has probability 0
+        self.most_likely = model.prob.argmax(axis=2)
+        self.first = tuple(np.take_along_axis(x, self.most_likely[..., None], axis=2)[..., 0]
+                           for x in (model.next_state, model.reward, model.done))
+        self._rows = {}
+
+    def _row(self, s):
+        "Python lists of the outcomes of state s, faster than NumPy scalar indexing in the dict loops"
+        m = self.model
+        outcomes = [list(zip(*(x[s, a].tolist() for x in (m.next_state, m.reward, m.done))))
+                    for a in range(m.prob.shape[1])]
+        single = [None if self.stochastic[s, a] else outcomes[a][self.most_likely[s, a]]
+                  for a in range(len(outcomes))]
+        row = self._rows[s] = (single, outcomes, self.accept[s].tolist(), self.alias[s].tolist())
+        return row
+
+    def step(self, s, a):
+        "(next_state, reward, done) of taking action a in state s"
+        row = self._rows.get(s) or self._row(s)
+        single = row[0][a]
+        if single is not None:
+            return single
+        outcomes = row[1][a]
+        u = random.random() * len(outcomes)
+        k = int(u)
+        if u - k >= row[2][a][k]:
+            k = row[3][a][k]
+        return outcomes[k]
+
+    def outcome_table(self):
+        "Nested lists of (next_state, reward, done) indexed [s][a] of a deterministic environment, else None"
+        if not self.deterministic:
+            return None
+        return [list(zip(*row)) for row in zip(*(x.tolist() for x in self.first))]
+
+    def sample(self, states, actions, rng=None):
+        "Arrays of next states, rewards and done flags of taking `actions` in `states`"
+        if self.deterministic:
+            return tuple(x[states, actions] for x in self.first)
+        rng = np.random.default_rng() if rng is None else rng
+        K = self.accept.shape[2]
+        u = rng.random(np.shape(states)) * K
+        k = u.astype(np.int64)
+        k = np.where(u - k < self.accept[states, actions, k], k, self.alias[states, actions, k])
+        m = self.model
+        return m.next_state[states, actions, k], m.reward[states, actions, k], m.done[states, actions, k]
+
+
+def q_table_to_dict(Q):
+    "Convert an (nS, nA) array into the Q[s][a] mapping used by `q_learning`, `sarsa` and `plot_q_value`"
+    Q_dict = defaultdict(dict)
+    for s, row in enumerate(Q.tolist()):
+        Q_dict[s] = dict(enumerate(row))
+    return Q_dict
+
+
+def _greedy(q):
+    "Index of the first maximum of a row, like np.argmax and max() over Q[s].items()"
+    return q.index(max(q))
+
+
+def _initial_q(env, initial_Q):
+    "Copy of initial_Q, e.g. the Q of `dynamic_programming.value_iteration`, or uniform random values"
+    if initial_Q is None:
+        return np.random.uniform(0, 1, (env.nS, env.nA))
+    return np.array(initial_Q, dtype=float)
+
+
+def q_learning_tabular(env, num_episodes=1000, step_size=0.8, discount_factor=1.0, callbacks=(), initial_Q=None):
+    "Same greedy Q-learning as `q_learning.q_learning`, returns Q as an (nS, nA) array"
+    sampler = TransitionSampler(env)
+    # deterministic outcomes are looked up without a call
+    step, outcomes = sampler.step, sampler.outcome_table()
+    Q = _initial_q(env, initial_Q)
+    # an episode is a chain of single element updates, which are faster on the rows of the
+    # arrays as lists than through NumPy scalar indexing
+    terminal, Q_rows = sampler.terminal.tolist(), Q.tolist()
+    # draw a random state to start every episode
+    for episode, init_state in enumerate(np.random.randint(env.nS, size=num_episodes).tolist()):
+        while not terminal[init_state]:
+            q = Q_rows[init_state]
+            init_action = _greedy(q)  # choose the action with max Q value for state
+            next_state, reward, _ = (outcomes[init_state][init_action] if outcomes is not None
+                                     else step(init_state, init_action))
+            q[init_action] += step_size * (reward + discount_factor * max(Q_rows[next_state]) - q[init_action])
+            init_state = next_state
+        for callback in callbacks:
+            callback.on_episode_end(episode, Q_rows)
+    Q[:] = Q_rows
+    for callback in callbacks:
+        callback.on_train_end(Q)
+    return Q
+
+
+def sarsa_tabular(env, num_episodes=1000, step_size=0.8, discount_factor=1.0, callbacks=(), initial_Q=None):
+    "Same greedy SARSA as `sarsa.sarsa`, returns Q as an (nS, nA) array"
+    sampler = TransitionSampler(env)
+    step, outcomes = sampler.step, sampler.outcome_table()
+    Q = _initial_q(env, initial_Q)
+    terminal, Q_rows = sampler.terminal.tolist(), Q.tolist()
+    # draw a random state to start every episode
+    for episode, init_state in enumerate(np.random.randint(env.nS, size=num_episodes).tolist()):
+        init_action = _greedy(Q_rows[init_state])  # choose the action with max Q value for state
+        while not terminal[init_state]:
+            next_state, reward, _ = (outcomes[init_state][init_action] if outcomes is not None
+                                     else step(init_state, init_action))
+            next_action = _greedy(Q_rows[next_state])
+            q = Q_rows[init_state]
+            q[init_action] += step_size * (reward + discount_factor * Q_rows[next_state][next_action] - q[init_action])
+            init_state = next_state
+            init_action = next_action
+        for callback in callbacks:
+            callback.on_episode_end(episode, Q_rows)
+    Q[:] = Q_rows
+    for callback in callbacks:
+        callback.on_train_end(Q)
+    return Q
+
+
+def _batched_td(env, num_episodes, step_size, discount_factor, num_agents, seed, sarsa):
+    "Greedy Q-learning (or SARSA) for independent agents stepping in lockstep, one Q table per agent"
+    sampler = TransitionSampler(env)
+    terminal = sampler.terminal
+    step_size, discount_factor = np.broadcast_arrays(np.atleast_1d(step_size).astype(float),
+                                                     np.atleast_1d(discount_factor).astype(float))
+    if num_agents is None:
+        num_agents = len(step_size)
+    step_size = np.broadcast_to(step_size, num_agents)
+    discount_factor = np.broadcast_to(discount_factor, num_agents)
+    rng = np.random.default_rng(seed)
+
+    Q = rng.uniform(0, 1, (num_agents, env.nS, env.nA))
+    agents = np.arange(num_agents)
+    episodes = np.zeros(num_agents, dtype=np.int64)  # finished episodes of every agent
+    state = rng.integers(env.nS, size=num_agents)  # draw a random state to start
+    action = Q[agents, state].argmax(axis=1)
+    while True:
+        # agents in a terminal state finish their episode and restart, unless they ran all their episodes
+        while True:
+            finished = (episodes < num_episodes) & terminal[state]
+            if not finished.any():
+                break
+            episodes[finished] += 1
+            restart = np.flatnonzero(finished & (episodes < num_episodes))
+            state[restart] = rng.integers(env.nS, size=len(restart))
+            action[restart] = Q[restart, state[restart]].argmax(axis=1)
+        active = np.flatnonzero(episodes < num_episodes)
+        if not len(active):
+            return Q
+        s = state[active]
+        a = Q[active, s].argmax(axis=1) if not sarsa else action[active]
+        next_s, reward, _ = sampler.sample(s, a, rng)
+        next_q = Q[active, next_s]
+        next_a = next_q.argmax(axis=1)
+        # SARSA bootstraps from the greedy next action, which it then takes, Q-learning from the max
+        target = next_q[np.arange(len(active)), next_a]
+        Q[active, s, a] += step_size[active] * (reward + discount_factor[active] * target
+                                                - Q[active, s, a])
+        state[active] = next_s
+        action[active] = next_a
+
+
+def batched_q_learning(env, num_episodes=1000, step_size=0.8, discount_factor=1.0, num_agents=None, seed=None):
+    """Run `num_agents` independent greedy Q-learning agents of `num_episodes` episodes each in lockstep.
+
+    `step_size` and `discount_factor` are scalars or one value per agent, which makes sweeps over
+    hyperparameters and seeds one call. Returns Q as a (num_agents, nS, nA) array.
+    """
+    return _batched_td(env, num_episodes, step_size, discount_factor, num_agents, seed, sarsa=False)
+
+
+def batched_sarsa(env, num_episodes=1000, step_size=0.8, discount_factor=1.0, num_agents=None, seed=None):
+    "Run independent greedy SARSA agents in lockstep, see `batched_q_learning`"
+    return _batched_td(env, num_episodes, step_size, discount_factor, num_agents, seed, sarsa=True)
+
+
+if __name__ == '__main__':
+    from gridworld import GridworldEnv
+
+    parser = argparse.ArgumentParser(description='sweep the step size of batched Q-learning/SARSA over many seeds')
+    parser.add_argument("--algorithm", choices=["q_learning", "sarsa"], default="q_learning")
+    parser.add_argument("--num_episodes", type=int, default=1000, help="number of episodes of every agent")
+    parser.add_argument("--num_seeds", type=int, default=100, help="number of agents per step size")
+    parser.add_argument("--step_sizes", type=float, nargs="+", default=[0.1, 0.2, 0.4, 0.8, 1.0])
+    args = parser.parse_args()
+    env = GridworldEnv((9, 9))
+    learner = batched_q_learning if args.algorithm == "q_learning" else batched_sarsa
+    step_size = np.repeat(args.step_sizes, args.num_seeds)
+    start = time.perf_counter()
+    Q = learner(env, args.num_episodes, step_size=step_size, seed=0)
+    print("{} agents x {} episodes in {:.2f}s".format(len(step_size), args.num_episodes, time.perf_counter() - start))
+    # mean greedy value over the non terminal states, averaged over the seeds of every step size
+    V = Q.max(axis=2)[:, ~compile_transitions(env).terminal].mean(axis=1).reshape(len(args.step_sizes), -1)
+    for alpha, v in zip(args.step_sizes, V):
+        print("step_size {}: mean V {:.3f} +- {:.3f}".format(alpha, v.mean(), v.std()))
@@ -0,0 +1,118 @@
+"""
+Observers for the training loops of `q_learning`, `sarsa` and the tabular engines.
+
+A loop calls `on_episode_end(episode, Q)` after every episode and `on_train_end(Q)` once at the
+end. Passing no callbacks (`callbacks=()`) trains silently without touching any I/O.
+"""
+from queue import Full, Queue
+import sys
+import threading
+
+import numpy as np
+
+
+def snapshot_q(Q):
+    "Copy of a Q table given as a Q[s][a] mapping, a list of rows or an array"
+    if isinstance(Q, np.ndarray):
+        return Q.copy()
+    if isinstance(Q, list):
+        return [list(q) for q in Q]
+    return {s: dict(q) for s, q in Q.items()}
+
+
+class Callback:
+    "Does nothing, subclasses override the events they are interested in"
+
+    def on_episode_end(self, episode, Q):
+        pass
+
+    def on_train_end(self, Q):
+        pass
+
+
+class RenderEvery(Callback):
+    "Render the greedy policy every `every` episodes"
+
+    def __init__(self, env, every=1):
+        self.env = env
+        self.every = every
+
+    def on_episode_end(self, episode, Q):
+        if (episode + 1) % self.every == 0:
+            self.env.plot_q_value(Q)
+            sys.stdout.flush()
+
+
+class RenderAtEnd(Callback):
+    "Render the greedy policy once, after training"
+
+    def __init__(self, env):
+        self.env = env
+
+    def on_train_end(self, Q):
+        self.env.plot_q_value(Q)
+        sys.stdout.flush()
+
+
+class LogEvery(Callback):
+    "Print the mean of the greedy values every `every` episodes"
+
+    def __init__(self, every=1000, file=None):
+        self.every = every
+        self.file = file
+
+    def on_episode_end(self, episode, Q):
+        if (episode + 1) % self.every == 0:
+            rows = Q.values() if isinstance(Q, dict) else Q
+            values = [max(q.values()) if isinstance(q, dict) else max(q) for q in rows]
+            print("episode {}: mean greedy value {:.3f}".format(episode + 1, sum(values) / len(values)),
+                  file=self.file or sys.stdout)
+
+
+class SnapshotEvery(Callback):
+    "Keep a copy of Q every `every` episodes in `snapshots`, as (episode, Q) pairs"
+
+    def __init__(self, every=1000):
+        self.every = every
+        self.snapshots = []
+
+    def on_episode_end(self, episode, Q):
+        if (episode + 1) % self.every == 0:
+            self.snapshots.append((episode, snapshot_q(Q)))
+
+
+class InBackground(Callback):
+    """Run `callback` in a background thread, fed through a bounded queue of Q snapshots.
+
+    Only every `every`-th episode is copied and queued. When the queue is full the snapshot is
+    dropped unless `block` is set, so a slow callback never stalls training by default.
+    """
+
+    def __init__(self, callback, every=1, maxsize=8, block=False):
+        self.callback = callback
+        self.every = every
+        self.block = block
+        self.num_dropped = 0
+        self.queue = Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.callback.on_episode_end(*item)
+
+    def on_episode_end(self, episode, Q):
+        if (episode + 1) % self.every != 0:
+            return
+        try:
+            self.queue.put((episode, snapshot_q(Q)), block=self.block)
+        except Full:
+            self.num_dropped += 1
+
+    def on_train_end(self, Q):
+        self.queue.put(None)
+        self.thread.join()
+        self.callback.on_train_end(Q)
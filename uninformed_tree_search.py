@@ -1,6 +1,8 @@
+from collections import deque
+import argparse
 import random
 
-from binary_tree import Node
+from binary_tree import Node, make_implicit_binary_tree
 
 
 def make_binary_tree_with_value(depth=12):
@@ -25,24 +27,105 @@ def make_binary_tree_with_value(depth=12):
     return root
 
 
-def tree_search(root, mode="bfs"):
-    """This implementation is according to the generic uninformed search method proposed in Peter & Russel 3.3"""
+class SearchStats:
+    "Counters of a tree search: expanded nodes, largest frontier and deepening iterations"
+
+    def __init__(self):
+        self.nodes_expanded = 0
+        self.peak_frontier = 0
+        self.iterations = 0
+
+    def __repr__(self):
+        return "SearchStats(nodes_expanded={}, peak_frontier={}, iterations={})".format(
+            self.nodes_expanded, self.peak_frontier, self.iterations)
+
+
+def iter_tree_search(root, mode="bfs", max_depth=None, stats=None):
+    """Yield the nodes in the order the generic uninformed search visits them.
+
+    "bfs" and "dfs" keep a deque as frontier, FIFO for BFS and LIFO for DFS. "iddfs" runs depth
+    limited DFS with growing limits and yields the nodes at the limit of every round, so it visits
+    in BFS order with a frontier bounded by the depth. `max_depth` stops expanding below that depth.
+    """
+    if stats is None:
+        stats = SearchStats()
+    if mode == "iddfs":
+        yield from _iterative_deepening(root, max_depth, stats)
+        return
+    if mode not in ("bfs", "dfs"):
+        raise ValueError("mode must be 'bfs', 'dfs' or 'iddfs', got {}".format(mode))
     # frontier is the set of all node available for expansion at any given point of time (set of unexpanded nodes)
     # init the frontier to contain the initial state, which is the root
-    frontier = [root]
+    frontier = deque([(root, 0)])
+    stats.iterations = 1
+    stats.peak_frontier = max(stats.peak_frontier, 1)
     while frontier:
         # FIFO to do BFS, and FILO to do DFS
-        if mode == "bfs":
-            leaf = frontier.pop(0)
-        elif mode == "dfs":
-            leaf = frontier.pop(-1)
-        # check if the leaf satisfies goal state, if yes, we have found the solution
-        print(leaf)
+        leaf, depth = frontier.popleft() if mode == "bfs" else frontier.pop()
+        yield leaf
         # now we expand the leaf nodes, and its children (if any) are added to the frontier
-        for child in leaf.find_children_list():
-            frontier.append(child)
+        if max_depth is None or depth < max_depth:
+            children = leaf.find_children_list()
+            if children:
+                stats.nodes_expanded += 1
+                frontier.extend((child, depth + 1) for child in children)
+                stats.peak_frontier = max(stats.peak_frontier, len(frontier))
+
+
+def _iterative_deepening(root, max_depth, stats):
+    limit = 0
+    while max_depth is None or limit <= max_depth:
+        stats.iterations += 1
+        cutoff = False
+        frontier = [(root, 0)]
+        while frontier:
+            leaf, depth = frontier.pop()
+            if depth == limit:
+                # shallower nodes were yielded in earlier rounds
+                yield leaf
+                cutoff = cutoff or not leaf.is_terminal()
+                continue
+            children = leaf.find_children_list()
+            stats.nodes_expanded += 1
+            # reversed, so the left child is popped first like in BFS
+            frontier.extend((child, depth + 1) for child in reversed(children))
+            stats.peak_frontier = max(stats.peak_frontier, len(frontier))
+        if not cutoff:
+            return
+        limit += 1
+
+
+def tree_search(root, mode="bfs", goal=None, max_depth=None, verbose=True, stats=None):
+    """This implementation is according to the generic uninformed search method proposed in Peter & Russel 3.3
+
+    Returns the first visited node satisfying `goal`, or None. Pass a `SearchStats` to get the counters.
+    """
+    for leaf in iter_tree_search(root, mode=mode, max_depth=max_depth, stats=stats):
+        if verbose:
+            print(leaf)
+        # check if the leaf satisfies goal state, if yes, we have found the solution
+        if goal is not None and goal(leaf):
+            return leaf
+    return None
 
 
 if __name__ == '__main__':
-    root = make_binary_tree_with_value(3)
-    tree_search(root)
+    parser = argparse.ArgumentParser(description='uninformed tree search on a binary tree')
+    parser.add_argument("--depth", type=int, default=3, help="number of depth of the binary tree")
+    parser.add_argument("--mode", choices=["bfs", "dfs", "iddfs"], default="bfs")
+    parser.add_argument("--implicit", action="store_true",
+                        help="search an implicit binary tree whose nodes are created on demand, for large depths")
+    parser.add_argument("--goal_value", type=float, default=None,
+                        help="stop at the first leaf with at least this value instead of visiting every node")
+    parser.add_argument("--quiet", action="store_true", help="do not print the visited nodes")
+    args = parser.parse_args()
+    if args.implicit:
+        root = make_implicit_binary_tree(args.depth)
+    else:
+        root = make_binary_tree_with_value(args.depth)
+    goal = None
+    if args.goal_value is not None:
+        goal = lambda n: n.is_terminal() and n.value >= args.goal_value
+    stats = SearchStats()
+    found = tree_search(root, mode=args.mode, goal=goal, verbose=not args.quiet, stats=stats)
+    print("Found: {}, {}".format(found, stats))